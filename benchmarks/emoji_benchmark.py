@@ -0,0 +1,49 @@
+"""
+Measure the time it takes to load the emoji table, and the throughput of
+`emoji.emojize` on long messages. Run with:
+
+    python benchmarks/emoji_benchmark.py
+"""
+
+import timeit
+
+from slackcli import emoji
+
+
+def main():
+    measure_startup()
+    measure_throughput()
+
+
+def measure_startup():
+    def first_emojize():
+        emoji.Emojis.TABLE = None
+        emoji.emojize("Hello :wave:")
+
+    number = 200
+    duration = timeit.timeit(first_emojize, number=number)
+    print("load table + first lookup: {:.1f} µs".format(duration / number * 1e6))
+
+
+def measure_throughput():
+    paragraph = (
+        "Deployed :rocket: to production at 12:30, all checks :white_check_mark: "
+        "except `make lint: failed` :warning:. Logs: ERROR: connection refused :: "
+        "retrying in 5s :hourglass:\n"
+    )
+    emoji.Emojis.index()
+    for size in [1024, 16 * 1024, 256 * 1024]:
+        text = (paragraph * (size // len(paragraph) + 1))[:size]
+        number = max(1, 2 * 1024 * 1024 // size)
+        duration = timeit.timeit(lambda: emoji.emojize(text), number=number)
+        print(
+            "{:>7} chars: {:8.1f} µs/message, {:6.1f} MB/s".format(
+                size,
+                duration / number * 1e6,
+                size * number / duration / 1e6,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -21,14 +21,15 @@ setup(
     install_requires=[
         "argcomplete",
         "appdirs<1.5",
-        "slack_sdk>=3.37.0",
+        # transport.PooledWebClient overrides a private WebClient method
+        "slack_sdk>=3.37.0,<4",
     ],
-    extras_require={"development": ["black", "pylint"]},
+    extras_require={"async": ["aiohttp"], "development": ["black", "pylint"]},
     license="MIT",
     author="Régis Behmo",
     author_email="nospam@behmo.com",
     packages=["slackcli"],
-    package_data={"slackcli": ["emoji.json"]},
+    package_data={"slackcli": ["emoji.tsv"]},
     entry_points={"console_scripts": ["slack-cli=slackcli.cli:main"]},
     classifiers=[
         "Programming Language :: Python",
@@ -0,0 +1,194 @@
+"""
+Optional asyncio backend, based on the slack_sdk AsyncWebClient. Independent API
+calls are run concurrently from a single thread, which makes it possible to have
+hundreds of requests in flight. This backend requires the aiohttp package:
+
+    pip install slack-cli[async]
+
+It is enabled with the `--async` option or the SLACK_CLI_ASYNC environment variable.
+"""
+
+import asyncio
+import os
+import random
+
+from . import directory
+from . import errors
+from . import messaging
+from . import names
+from . import slack
+
+ENABLED = "SLACK_CLI_ASYNC" in os.environ
+# Maximum number of concurrent requests for a single operation
+MAX_CONCURRENT_REQUESTS = 50
+# Histories are held in memory: longer histories are streamed by the threaded
+# backend instead
+MAX_HISTORY_COUNT = 1000
+
+
+def enable():
+    # pylint: disable=global-statement
+    global ENABLED
+    try:
+        # pylint: disable=import-outside-toplevel,unused-import
+        import aiohttp
+    except ImportError:
+        raise errors.SlackCliError(
+            "The asyncio backend requires aiohttp. Install it with:"
+            " pip install slack-cli[async]"
+        )
+    ENABLED = True
+
+
+def run(coroutine):
+    """
+    Run a coroutine in a new event loop, and close the HTTP session when it is
+    complete.
+    """
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await slack.client().close_async_client()
+
+    return asyncio.run(main())
+
+
+async def call(method, max_retries=5, **kwargs):
+    """
+    Same as `slack.call`, for asyncio API methods.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await method(**kwargs)
+        except slack.BaseError as e:
+            delay = slack.retry_after(e)
+            if delay is None or attempt >= max_retries:
+                raise
+        attempt += 1
+        await asyncio.sleep(delay + random.uniform(0, 1))
+
+
+async def fetch_pages(method, key, limit=500, **kwargs):
+    """
+    Same as `slack.iter_pages`, but return all items at once.
+    """
+    items = []
+    cursor = None
+    while True:
+        response = await call(method, limit=limit, cursor=cursor, **kwargs)
+        items += response.get(key, [])
+        cursor = response.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return items
+
+
+async def load_resources():
+    """
+    Return the (resource type, resource) tuples of all channels, groups, IMs and
+    users, in the same order as `messaging.iter_resources`.
+    """
+    client = slack.async_client()
+
+    async def fetch(method, key, **kwargs):
+        try:
+            return await fetch_pages(method, key, **kwargs)
+        except slack.BaseError as e:
+            # Same as `messaging.iter_resources`
+            if not slack.is_permission_error(e):
+                raise
+            return []
+
+    channels, groups, ims, users = await asyncio.gather(
+        fetch(client.conversations_list, "channels", types="public_channel"),
+        fetch(client.conversations_list, "channels", types="private_channel"),
+        fetch(client.conversations_list, "channels", types="im"),
+        fetch(client.users_list, "members"),
+    )
+
+    # DMs don't have a "name" field: use the list of users to add the username
+    names.UserIndex.instance().add_members(users, listed=bool(users))
+    named_ims = []
+    for im in ims:
+        if "user" in im:
+            try:
+                im["name"] = names.username(im["user"])
+            except slack.BaseError:
+                continue
+        named_ims.append(im)
+
+    resources = []
+    for resource_type, items in zip(
+        directory.RESOURCE_TYPES, [channels, groups, named_ims, users]
+    ):
+        resources += [(resource_type, item) for item in items]
+    return resources
+
+
+async def fetch_history(conversation_id, count=None, oldest=None, latest=None):
+    """
+    Same as `messaging.iter_history_pages`, but return all messages at once, most
+    recent first. All messages are held in memory, so `count` should be at most
+    `MAX_HISTORY_COUNT`.
+    """
+    client = slack.async_client()
+    messages = []
+    while count is None or len(messages) < count:
+        response = await call(
+            client.conversations_history,
+            channel=conversation_id,
+            limit=1000 if count is None else min(count - len(messages), 1000),
+            oldest=oldest,
+            latest=latest,
+            inclusive=False,
+        )
+        page = response.get("messages", [])
+        messages += page
+        if not response.get("has_more", False) or not page:
+            break
+        latest = page[-1]["ts"]
+    return messages
+
+
+async def fetch_histories(conversation_ids, count=None, oldest=None, latest=None):
+    """
+    Fetch the history of multiple conversations concurrently.
+    """
+    return await asyncio.gather(
+        *[
+            fetch_history(conversation_id, count, oldest=oldest, latest=latest)
+            for conversation_id in conversation_ids
+        ]
+    )
+
+
+async def post_messages(destination_ids, text, pre=False, username=None):
+    """
+    Post the same message to multiple destinations concurrently. Return a dict of
+    destination id -> error, for the failed deliveries.
+    """
+    if not pre and messaging.parse_status_update(text):
+        # Status updates are not sent to any destination
+        messaging.post_message(None, text)
+        return {}
+
+    client = slack.async_client()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def post(destination_id):
+        async with semaphore:
+            try:
+                await call(
+                    client.chat_postMessage,
+                    **messaging.message_arguments(
+                        destination_id, text, pre=pre, username=username
+                    )
+                )
+            except slack.BaseError as e:
+                return destination_id, e.response.get("error", str(e))
+        return destination_id, None
+
+    results = await asyncio.gather(*[post(d) for d in destination_ids])
+    return {destination_id: error for destination_id, error in results if error}
@@ -0,0 +1,288 @@
+"""
+Local, per-team archive of conversation histories, stored in an SQLite database.
+Conversations are synchronized incrementally: only the messages that are more
+recent than the last synchronized message are fetched from the API.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+from . import cache
+from . import errors
+from . import messaging
+from . import token
+
+__all__ = ["Archive", "sync", "is_archived", "is_fresh", "iter_pages", "search"]
+
+
+ARCHIVE_ROOT = os.path.join(token.CONFIG_ROOT, "archive")
+# Archived conversations that were synchronized less than TTL seconds ago are read
+# without calling the API
+TTL = int(os.environ.get("SLACK_CLI_ARCHIVE_TTL", 60))
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS messages (
+        channel TEXT NOT NULL,
+        ts TEXT NOT NULL,
+        user TEXT,
+        text TEXT,
+        data TEXT NOT NULL,
+        PRIMARY KEY (channel, ts)
+    )""",
+    # High-water mark of each synchronized conversation
+    """CREATE TABLE IF NOT EXISTS sync_state (
+        channel TEXT PRIMARY KEY,
+        latest_ts TEXT,
+        synced REAL NOT NULL
+    )""",
+    # Full-text index of message texts, kept in sync with the messages table
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        text, content='messages', content_rowid='rowid'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, text)
+        VALUES ('delete', old.rowid, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_update AFTER UPDATE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, text)
+        VALUES ('delete', old.rowid, old.text);
+        INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+    END""",
+]
+
+
+class Archive:
+    """
+    Connection to the message archive. Connections must not be shared across
+    threads.
+
+    Usage:
+
+        with Archive() as archive:
+            archive.store(channel_id, messages)
+    """
+
+    def __init__(self, path=None):
+        path = path or archive_path()
+        token.ensure_directory_exists(path)
+        self.connection = sqlite3.connect(path, timeout=30)
+        # Write-ahead logging allows reads during a concurrent synchronization
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            indexed = self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+            ).fetchone()
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+            if not indexed:
+                # Index the messages of archives that were created without an index
+                self.connection.execute(
+                    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')"
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def store(self, channel, messages):
+        """
+        Insert or update messages. Return the number of stored messages.
+        """
+        rows = [
+            (
+                channel,
+                message["ts"],
+                message.get("user") or message.get("bot_id"),
+                message.get("text", ""),
+                json.dumps(message),
+            )
+            for message in messages
+        ]
+        with self.connection:
+            self.connection.executemany(
+                # Updates, unlike replacements, trigger the update of the index
+                "INSERT INTO messages (channel, ts, user, text, data)"
+                " VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (channel, ts) DO UPDATE SET"
+                " user = excluded.user, text = excluded.text, data = excluded.data",
+                rows,
+            )
+        return len(rows)
+
+    def sync_state(self, channel):
+        """
+        Return the (latest timestamp, synchronization time) of an archived
+        conversation, or None.
+        """
+        return self.connection.execute(
+            "SELECT latest_ts, synced FROM sync_state WHERE channel = ?", (channel,)
+        ).fetchone()
+
+    def mark_synced(self, channel, latest_ts):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sync_state (channel, latest_ts, synced)"
+                " VALUES (?, ?, ?)",
+                (channel, latest_ts, time.time()),
+            )
+
+    def iter_pages(self, channel, count=None, oldest=None, latest=None, size=1000):
+        """
+        Iterate on pages of archived messages, with the same semantics as
+        `messaging.iter_history_pages`.
+        """
+        query = "SELECT data FROM messages WHERE channel = ?"
+        parameters = [channel]
+        if oldest is not None:
+            query += " AND ts > ?"
+            parameters.append(timestamp(oldest))
+        if latest is not None:
+            query += " AND ts < ?"
+            parameters.append(timestamp(latest))
+        query += " ORDER BY ts DESC"
+        if count is not None:
+            query += " LIMIT ?"
+            parameters.append(count)
+        cursor = self.connection.execute(query, parameters)
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            yield [json.loads(row[0]) for row in rows]
+
+    # pylint: disable=too-many-arguments
+    def search(
+        self,
+        query,
+        channels=None,
+        users=None,
+        oldest=None,
+        latest=None,
+        count=None,
+        newest_first=False,
+    ):
+        """
+        Iterate on the (channel, message) tuples of the archived messages that match
+        a full-text query, in chronological order or with the most recent first.
+        With `count`, only the most recent matches are returned. Results may be
+        restricted to lists of channel and user IDs, and to a time range.
+        """
+        query_sql = (
+            "SELECT messages.channel, messages.ts, messages.data FROM messages_fts"
+            " JOIN messages ON messages.rowid = messages_fts.rowid"
+            " WHERE messages_fts MATCH ?"
+        )
+        parameters = [match_expression(query)]
+        for column, values in [("channel", channels), ("user", users)]:
+            if values:
+                # The unary "+" keeps the planner from scanning the channel index
+                query_sql += " AND +messages.{} IN ({})".format(
+                    column, ", ".join("?" * len(values))
+                )
+                parameters += values
+        if oldest is not None:
+            query_sql += " AND messages.ts > ?"
+            parameters.append(timestamp(oldest))
+        if latest is not None:
+            query_sql += " AND messages.ts < ?"
+            parameters.append(timestamp(latest))
+        if count is not None:
+            query_sql = "SELECT * FROM ({} ORDER BY messages.ts DESC LIMIT ?)".format(
+                query_sql
+            )
+            parameters.append(count)
+        query_sql += " ORDER BY ts DESC" if newest_first else " ORDER BY ts"
+        cursor = self.connection.execute(query_sql, parameters)
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for channel, _ts, data in rows:
+                yield channel, json.loads(data)
+
+
+def match_expression(query):
+    """
+    Convert a search query to an FTS5 expression that matches messages containing
+    all words of the query. Words are quoted, such that identifiers and host names,
+    e.g: "db-01.prod", are matched as phrases instead of being parsed as operators.
+    """
+    words = query.split()
+    if not words:
+        raise errors.SlackCliError("Empty search query")
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+def archive_path():
+    return os.path.join(ARCHIVE_ROOT, cache.team_key(), "messages.sqlite3")
+
+
+def timestamp(value):
+    """
+    Slack timestamps are compared as strings in the archive: normalize them to the
+    same format as message timestamps, e.g: "1700000000.000100".
+    """
+    return "{:017.6f}".format(float(value))
+
+
+def sync(conversation_id):
+    """
+    Fetch and archive the messages of a conversation that are more recent than the
+    last synchronization. Return the number of new messages.
+    """
+    with Archive() as archive:
+        state = archive.sync_state(conversation_id)
+        previous_latest_ts = state[0] if state else None
+        latest_ts = previous_latest_ts
+        count = 0
+        for page in messaging.iter_history_pages(
+            conversation_id, oldest=previous_latest_ts
+        ):
+            count += archive.store(conversation_id, page)
+            if latest_ts is None or page[0]["ts"] > latest_ts:
+                latest_ts = page[0]["ts"]
+        # The high-water mark is only moved once all pages are stored, such that an
+        # interrupted synchronization does not leave a gap in the archive
+        archive.mark_synced(conversation_id, latest_ts)
+    return count
+
+
+def is_archived(conversation_id):
+    if not os.path.exists(archive_path()):
+        return False
+    with Archive() as archive:
+        return archive.sync_state(conversation_id) is not None
+
+
+def is_fresh(conversation_id, ttl=TTL):
+    with Archive() as archive:
+        state = archive.sync_state(conversation_id)
+    return state is not None and time.time() - state[1] <= ttl
+
+
+def iter_pages(conversation_id, count=None, oldest=None, latest=None):
+    with Archive() as archive:
+        yield from archive.iter_pages(
+            conversation_id, count=count, oldest=oldest, latest=latest
+        )
+
+
+def search(query, **kwargs):
+    """
+    Search the archive: see `Archive.search`.
+    """
+    if not os.path.exists(archive_path()):
+        # Do not create an empty archive
+        raise errors.SlackCliError("No archive: run --sync first")
+    with Archive() as archive:
+        yield from archive.search(query, **kwargs)
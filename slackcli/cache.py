@@ -0,0 +1,83 @@
+"""
+Persistent, per-team storage for API results that rarely change, such as the list
+of channels and users. Files are stored in the slack-cli configuration directory.
+"""
+
+import json
+import os
+import time
+
+from . import errors
+from . import slack
+from . import token
+
+__all__ = ["load", "save", "remove"]
+
+
+CACHE_ROOT = os.path.join(token.CONFIG_ROOT, "cache")
+# Maximum age of cached data, in seconds
+TTL = int(os.environ.get("SLACK_CLI_CACHE_TTL", 24 * 60 * 60))
+
+
+# token -> team ID
+TEAM_IDS = {}
+
+
+def team_key():
+    """
+    Data is stored per team ID, and not per token, such that it survives token
+    rotations and is shared by all the tokens of a team, e.g: user and bot tokens.
+    The team ID of a token is saved next to it in the teams file, or fetched once
+    per run if the token was not saved.
+    """
+    user_token = slack.client().token
+    if user_token not in TEAM_IDS:
+        team_id = token.load_team_id(user_token)
+        if team_id is None:
+            team_id = slack.client().auth_test()["team_id"]
+            token.save_team_id(user_token, team_id)
+        TEAM_IDS[user_token] = team_id
+    return TEAM_IDS[user_token]
+
+
+def path(name):
+    return os.path.join(CACHE_ROOT, team_key(), name)
+
+
+def load(name, ttl=TTL):
+    """
+    Load cached data. Return None if the data is missing, corrupted or older than
+    `ttl` seconds.
+    """
+    try:
+        with open(path(name)) as cache_file:
+            data = json.load(cache_file)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(data, dict) or time.time() - data.get("updated", 0) > ttl:
+        return None
+    return data
+
+
+def save(name, data):
+    """
+    Save data to the cache. The "updated" field is set to the current time. Failing
+    to write the cache is not an error: we will simply fetch the data again next time.
+    """
+    data["updated"] = time.time()
+    cache_path = path(name)
+    tmp_path = cache_path + ".tmp"
+    try:
+        token.ensure_directory_exists(cache_path)
+        with open(tmp_path, "w") as cache_file:
+            json.dump(data, cache_file)
+        os.replace(tmp_path, cache_path)
+    except (IOError, errors.ConfigSaveError):
+        pass
+
+
+def remove(name):
+    try:
+        os.remove(path(name))
+    except IOError:
+        pass
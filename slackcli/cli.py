@@ -2,16 +2,40 @@
 # PYTHON_ARGCOMPLETE_OK
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import itertools
+import queue
+import re
 import subprocess
 import sys
+import threading
+import time
 
 import argcomplete
 
+from . import aio
+from . import archive
+from . import directory
 from . import errors
+from . import export
+from . import names
 from . import slack
 from . import stream
 from . import token
 from . import messaging
+from . import sender
+
+
+# Relative durations, such as "30m" or "2h"
+DURATION_PATTERN = re.compile(r"^(\d+)([smhdw])$")
+DURATION_UNITS = {
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": 24 * 60 * 60,
+    "w": 7 * 24 * 60 * 60,
+}
 
 
 def resource_completer(**kwargs):
@@ -19,7 +43,7 @@ def resource_completer(**kwargs):
     # "$(register-python-argcomplete slack-cli)"`. Note that this works in bash
     # only, not in zsh.
     slack.init()
-    return [r["name"] for _, r in messaging.iter_resources()]
+    return [r["name"] for _, r in messaging.iter_directory()]
 
 
 def main():
@@ -50,10 +74,28 @@ def run():
         url: https://xxx.slack.com. Use this option to interact with different teams. If
         unspecified, default to the team that was last used.""",
     )
+    parser.add_argument(
+        "--async",
+        action="store_true",
+        dest="use_async",
+        help="""Run independent API calls concurrently with asyncio. This requires the
+        aiohttp package.""",
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="""Fetch the list of channels, groups and users from the Slack API instead
+        of reading it from the local cache""",
+    )
 
     group_send = parser.add_argument_group("Send messages")
     group_send.add_argument(
-        "-d", "--dst", help="Send message to a Slack channel, group or username"
+        "-d",
+        "--dst",
+        action="append",
+        help="""Send message to a Slack channel, group or username. Slack IDs, such as
+        C0123ABCD, are also accepted. This option can be specified multiple times,
+        and multiple destinations can be separated by commas.""",
     ).completer = resource_completer
     group_send.add_argument("-f", "--file", help="Upload file")
     group_send.add_argument(
@@ -71,6 +113,23 @@ def run():
         help="""Send message not as the current user, but as a bot with the
         specified user name""",
     )
+    group_send.add_argument(
+        "--batch-interval",
+        type=float,
+        help="""When piping content, group the lines that arrive within this number
+        of seconds in a single message""",
+    )
+    group_send.add_argument(
+        "--batch-max-lines",
+        type=int,
+        help="Maximum number of lines in a single message when piping content",
+    )
+    group_send.add_argument(
+        "--batch-max-bytes",
+        type=int,
+        help="""Maximum size of a single message when piping content, in bytes
+        (default and maximum: {})""".format(messaging.MAX_MESSAGE_BYTES),
+    )
     group_send.add_argument(
         "messages",
         nargs="*",
@@ -92,14 +151,89 @@ def run():
         "-l",
         "--last",
         type=int,
-        help="""Print the last N messages. If this option
-                               is not specified, messages will be streamed from
-                               the requested sources.""",
+        help="""Print the last N messages. If neither this
+                               option nor --since/--until are specified,
+                               messages will be streamed from the requested
+                               sources.""",
+    )
+    group_receive.add_argument(
+        "--since",
+        type=parse_time,
+        help="""Print messages posted after this time. Times
+                               are Unix timestamps, ISO 8601 dates such as
+                               2024-05-01T14:00, or durations relative to now,
+                               such as 30m, 2h, 1d or 1w.""",
+    )
+    group_receive.add_argument(
+        "--until",
+        type=parse_time,
+        help="""Print messages posted before this time. With
+                               --since and/or --until, --last is the maximum
+                               number of messages to print.""",
+    )
+    group_receive.add_argument(
+        "--sync",
+        action="store_true",
+        help="""Save the history of the sources in a local
+                               archive, or fetch only the new messages if they
+                               were already archived. The history of archived
+                               sources is then read from the archive.""",
+    )
+    group_receive.add_argument(
+        "--export",
+        metavar="DIRECTORY",
+        help="""Export the raw history of the sources to
+                               compressed JSON Lines files in this directory,
+                               one per source. Interrupted exports are resumed
+                               when the same command is run again.""",
+    )
+    group_receive.add_argument(
+        "--search",
+        metavar="QUERY",
+        help="""Search the local archive for messages that
+                               contain all words of the query. Results can be
+                               restricted to the --src sources, to the --from
+                               users and to a --since/--until time range.""",
+    )
+    group_receive.add_argument(
+        "--from",
+        action="append",
+        dest="from_users",
+        metavar="USER",
+        help="""Search only the messages of this user. This
+                               option can be specified multiple times.""",
+    ).completer = resource_completer
+    group_receive.add_argument(
+        "--follow",
+        action="store_true",
+        help="""Print the last messages (--last, default: 10,
+                               or --since) and then stream new messages, without
+                               missing or repeating any message.""",
+    )
+    group_receive.add_argument(
+        "--overflow",
+        choices=stream.OVERFLOW_POLICIES,
+        default="block",
+        help="""When streaming, what to do with incoming
+                               messages when they arrive faster than they can be
+                               printed: wait (default), drop the oldest pending
+                               messages, or spill them to disk.""",
+    )
+    group_receive.add_argument(
+        "--newest-first",
+        action="store_true",
+        help="""Print the last messages from the most recent
+                               to the oldest. Messages are printed as soon as
+                               they are fetched.""",
     )
 
     argcomplete.autocomplete(parser)
     args = parser.parse_args()
     slack.init(user_token=args.token, team=args.team)
+    if args.refresh_cache:
+        directory.invalidate()
+    if args.use_async:
+        aio.enable()
 
     # Debug command line arguments
     error_message = args_error_message(args)
@@ -110,45 +244,166 @@ def run():
 
     ### Receive messages
 
+    # Search archive
+    if args.search:
+        search_messages(
+            args.search,
+            sources=args.src,
+            users=args.from_users,
+            count=args.last,
+            newest_first=args.newest_first,
+            oldest=args.since,
+            latest=args.until,
+        )
+        return 0
+
+    # Export history
+    if args.src and args.export:
+        return 1 if export_sources(args.src, args.export) else 0
+
+    # Synchronize archive
+    if args.src and args.sync:
+        sync_sources(args.src)
+        return 0
+
     # Stream content
-    if args.src and args.last is None:
-        stream.receive(args.src)
+    if args.src and args.follow:
+        stream.receive(
+            args.src,
+            overflow=args.overflow,
+            last=10 if args.last is None and not args.since else args.last,
+            since=args.since,
+        )
+        return 0
+    history = args.last is not None or args.since or args.until
+    if args.src and not history:
+        stream.receive(args.src, overflow=args.overflow)
         return 0
 
     # Print last messages
-    if args.src and args.last is not None:
-        last_messages(args.src, args.last)
+    if args.src:
+        last_messages(
+            args.src,
+            args.last,
+            newest_first=args.newest_first,
+            oldest=args.since,
+            latest=args.until,
+        )
         return 0
 
     ### Send messages
 
+    # Resolve all destinations at once, before sending anything
+    destinations = parse_destinations(args.dst)
+    destination_ids = [messaging.get_destination_id(d) for d in destinations]
+
     # Send file
     if args.file:
-        upload_file(args.dst, args.file)
+        for destination_id in destination_ids:
+            upload_file(destination_id, args.file)
         return 0
 
-    # Pipe content
-    if not args.messages:
-        pipe(args.dst, pre=args.pre, username=args.user)
-        return 0
-
-    # Send messages
-    for message in args.messages:
-        if args.run:
-            run_command(args.dst, message, username=args.user)
+    # Send messages concurrently with asyncio
+    if aio.ENABLED and args.messages and not args.run:
+        errors_by_id = {}
+        for message in args.messages:
+            errors_by_id.update(
+                aio.run(
+                    aio.post_messages(
+                        destination_ids, message, pre=args.pre, username=args.user
+                    )
+                )
+            )
+        report_deliveries(destinations, destination_ids, errors_by_id)
+        return 1 if errors_by_id else 0
+
+    with sender.Sender(workers=min(len(destination_ids), 8)) as message_sender:
+        # Pipe content
+        if not args.messages:
+            pipe(
+                message_sender,
+                destination_ids,
+                pre=args.pre,
+                username=args.user,
+                batch_interval=args.batch_interval,
+                batch_max_lines=args.batch_max_lines,
+                batch_max_bytes=args.batch_max_bytes,
+            )
+
+        # Send messages
+        for message in args.messages:
+            if args.run:
+                run_command(
+                    message_sender, destination_ids, message, username=args.user
+                )
+            else:
+                send_message(
+                    message_sender,
+                    destination_ids,
+                    message,
+                    pre=args.pre,
+                    username=args.user,
+                )
+
+    report_deliveries(destinations, destination_ids, message_sender.errors)
+    if message_sender.retried or message_sender.dropped or message_sender.sent > 1:
+        sys.stderr.write("Messages: {}\n".format(message_sender.summary()))
+    return 1 if message_sender.dropped else 0
+
+
+def report_deliveries(destinations, destination_ids, errors_by_id):
+    """
+    Print the delivery status of each destination, when there are more than one.
+    """
+    if len(destinations) <= 1:
+        return
+    for destination, destination_id in zip(destinations, destination_ids):
+        error = errors_by_id.get(destination_id)
+        if error:
+            sys.stderr.write("❌ {}: {}\n".format(destination, error))
         else:
-            send_message(args.dst, message, pre=args.pre, username=args.user)
-    return 0
+            sys.stderr.write("✅ {}\n".format(destination))
+
+
+def parse_destinations(destinations):
+    """
+    Split comma-separated destinations, and remove duplicates.
+    """
+    parsed = []
+    for destination in destinations:
+        for name in destination.split(","):
+            name = name.strip()
+            if name and name not in parsed:
+                parsed.append(name)
+    return parsed
 
 
 # pylint: disable=too-many-return-statements
 def args_error_message(args):
     if args.dst and args.src:
         return "Incompatible arguments: --src and --dst\n"
-    if not args.dst and not args.src:
+    if args.dst and args.search:
+        return "Incompatible arguments: --dst and --search\n"
+    if args.from_users and not args.search:
+        return "Invalid arguments: --from requires --search\n"
+    if args.search is not None and not args.search.strip():
+        return "Invalid arguments: --search requires search terms\n"
+    if not args.dst and not args.src and not args.search:
         return "Invalid arguments: one of --src or --dst must be specified\n"
     if args.dst and args.last:
         return "Incompatible arguments: --dst and --last\n"
+    if args.follow and (not args.src or "all" in args.src):
+        return "Invalid arguments: --follow requires --src, other than 'all'\n"
+    if args.follow and args.until:
+        return "Incompatible arguments: --follow and --until\n"
+    if args.sync and not args.src:
+        return "Invalid arguments: --sync requires --src\n"
+    if args.export and not args.src:
+        return "Invalid arguments: --export requires --src\n"
+    if args.dst and (args.since or args.until):
+        return "Incompatible arguments: --dst and --since/--until\n"
+    if args.since and args.until and float(args.since) >= float(args.until):
+        return "Invalid arguments: --since must be earlier than --until\n"
     if args.src and args.file:
         return "Incompatible arguments: --src and --file\n"
     if args.file and args.messages:
@@ -160,34 +415,307 @@ def args_error_message(args):
 ######### Receive
 
 
-def last_messages(sources, count):
-    for source in sources:
-        messaging.print_messages(source, count=count)
+def parse_time(value):
+    """
+    Convert a Unix timestamp, an ISO 8601 date or a duration relative to now (e.g:
+    "2h") to a Slack timestamp string. Dates without timezone are in local time.
+    """
+    match = DURATION_PATTERN.match(value)
+    if match:
+        seconds = int(match.group(1)) * DURATION_UNITS[match.group(2)]
+        timestamp = time.time() - seconds
+    else:
+        try:
+            timestamp = float(value)
+        except ValueError:
+            try:
+                # Python < 3.11 does not support the "Z" suffix
+                timestamp = datetime.fromisoformat(
+                    re.sub(r"Z$", "+00:00", value)
+                ).timestamp()
+            except ValueError:
+                raise argparse.ArgumentTypeError(
+                    "invalid time: '{}'".format(value)
+                ) from None
+    return "{:.6f}".format(timestamp)
+
+
+def sync_sources(sources):
+    conversations = [messaging.get_conversation(source) for source in sources]
+    with ThreadPoolExecutor(max_workers=min(len(conversations), 4)) as executor:
+        counts = executor.map(
+            lambda conversation: archive.sync(conversation[1]), conversations
+        )
+        for (source_name, _), count in zip(conversations, counts):
+            sys.stderr.write("✅ {}: {} new messages\n".format(source_name, count))
+
+
+# pylint: disable=too-many-arguments
+def search_messages(
+    query,
+    sources=None,
+    users=None,
+    count=None,
+    newest_first=False,
+    oldest=None,
+    latest=None,
+):
+    """
+    Print the archived messages that match a query. Results are read from the local
+    archive only, without synchronizing it.
+    """
+    channel_ids = [messaging.get_conversation(source)[1] for source in sources or []]
+    user_ids = [
+        messaging.get_destination_id("@" + user.lstrip("@")) for user in users or []
+    ]
+    results = archive.search(
+        query,
+        channels=channel_ids,
+        users=user_ids,
+        oldest=oldest,
+        latest=latest,
+        count=count,
+        newest_first=newest_first,
+    )
+    # Prefetch user names by batches of results
+    while True:
+        batch = list(itertools.islice(results, 1000))
+        if not batch:
+            break
+        messaging.prefetch_names([message for _, message in batch])
+        for channel_id, message in batch:
+            print(
+                messaging.format_incoming_message(
+                    archived_source_name(channel_id), message
+                )
+            )
+
+
+def archived_source_name(channel_id):
+    """
+    Name of an archived conversation, from the directory or, when the directory
+    expired or the conversation was synchronized by ID, from the API.
+    """
+    source_name = directory.name(channel_id)
+    if source_name is None:
+        try:
+            source_name = names.sourcename(channel_id)
+        except slack.BaseError:
+            # The conversation may have been deleted since it was archived
+            source_name = channel_id
+    return source_name
+
+
+def export_sources(sources, export_directory):
+    """
+    Export the sources and print the status of each of them. Return the number of
+    sources that could not be exported.
+    """
+    conversations = [messaging.get_conversation(source) for source in sources]
+    failed = 0
+    for source_name, count, error in export.export(conversations, export_directory):
+        if isinstance(error, errors.AlreadyExportedError):
+            sys.stderr.write(
+                "⚠️ {}: already exported to {} ({} messages). To export newer"
+                " messages, choose a new export directory.\n".format(
+                    source_name,
+                    export.export_path(export_directory, source_name),
+                    count,
+                )
+            )
+        elif error:
+            failed += 1
+            sys.stderr.write(
+                "❌ {}: {} ({} messages exported)\n".format(source_name, error, count)
+            )
+        else:
+            sys.stderr.write(
+                "✅ {}: {} messages exported to {}\n".format(
+                    source_name,
+                    count,
+                    export.export_path(export_directory, source_name),
+                )
+            )
+    return failed
+
+
+def last_messages(sources, count, newest_first=False, oldest=None, latest=None):
+    if aio.ENABLED and count is not None and count <= aio.MAX_HISTORY_COUNT:
+        # Fetch all sources concurrently. Archived sources are read from the archive.
+        # Unbounded and long histories, which would not fit in memory, are streamed
+        # below instead.
+        conversations = [messaging.get_conversation(source) for source in sources]
+        remote_ids = [
+            conversation_id
+            for _, conversation_id in conversations
+            if not archive.is_archived(conversation_id)
+        ]
+        histories = {}
+        if remote_ids:
+            histories = dict(
+                zip(
+                    remote_ids,
+                    aio.run(
+                        aio.fetch_histories(
+                            remote_ids, count, oldest=oldest, latest=latest
+                        )
+                    ),
+                )
+            )
+        streams = []
+        for source_name, conversation_id in conversations:
+            if conversation_id in histories:
+                messages = histories[conversation_id]
+                messaging.prefetch_names(messages)
+                if not newest_first:
+                    messages = messages[::-1]
+            else:
+                messages = messaging.iter_in_background(
+                    messaging.iter_conversation_messages(
+                        conversation_id,
+                        count,
+                        newest_first=newest_first,
+                        oldest=oldest,
+                        latest=latest,
+                    )
+                )
+            streams.append(messaging.tag_messages(source_name, messages))
+        for source_name, message in messaging.merge_timelines(
+            streams, newest_first=newest_first
+        ):
+            print(messaging.format_incoming_message(source_name, message))
+        return
+    if len(sources) > 1:
+        messaging.print_timeline(
+            sources,
+            count=count,
+            newest_first=newest_first,
+            oldest=oldest,
+            latest=latest,
+        )
+        return
+    messaging.print_messages(
+        sources[0],
+        count=count,
+        newest_first=newest_first,
+        oldest=oldest,
+        latest=latest,
+    )
 
 
 ######### Send
 
 
-def pipe(destination, pre=False, username=None):
-    destination_id = messaging.get_destination_id(destination)
-    for line in sys.stdin:
-        line = line.strip()
-        if line:
-            messaging.post_message(destination_id, line, pre=pre, username=username)
-
-
-def run_command(destination, command, username=None):
-    destination_id = messaging.get_destination_id(destination)
+# pylint: disable=too-many-arguments
+def pipe(
+    message_sender,
+    destination_ids,
+    pre=False,
+    username=None,
+    batch_interval=None,
+    batch_max_lines=None,
+    batch_max_bytes=None,
+):
+    if batch_interval is None and batch_max_lines is None and batch_max_bytes is None:
+        for line in sys.stdin:
+            line = line.strip()
+            if line:
+                for destination_id in destination_ids:
+                    message_sender.send(
+                        destination_id, line, pre=pre, username=username
+                    )
+        return
+
+    max_bytes = min(
+        batch_max_bytes or messaging.MAX_MESSAGE_BYTES, messaging.MAX_MESSAGE_BYTES
+    )
+    if pre:
+        # Keep some room for the verbatim marks
+        max_bytes -= 6
+    for lines in iter_batches(
+        sys.stdin,
+        interval=batch_interval,
+        max_lines=batch_max_lines,
+        max_bytes=max_bytes,
+    ):
+        for destination_id in destination_ids:
+            message_sender.send(
+                destination_id, "\n".join(lines), pre=pre, username=username
+            )
+
+
+def iter_batches(stream, interval=None, max_lines=None, max_bytes=None):
+    """
+    Group the non-empty lines of a stream in lists of lines. A batch is complete
+    `interval` seconds after its first line was read, or when it would exceed
+    `max_lines` lines or `max_bytes` bytes (newlines included), or at the end of the
+    stream. Lines that are longer than `max_bytes` are split.
+    """
+    lines = queue.Queue(maxsize=10000)
+
+    def read():
+        for line in stream:
+            lines.put(line)
+        lines.put(None)
+
+    # Read the stream in a separate thread, such that we can flush batches even
+    # when no line is coming in
+    threading.Thread(target=read, daemon=True).start()
+
+    batch = []
+    size = 0
+    deadline = None
+    while True:
+        timeout = None if deadline is None else max(0, deadline - time.monotonic())
+        try:
+            line = lines.get(timeout=timeout)
+        except queue.Empty:
+            line = ""
+        if line is None:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            yield batch
+            batch, size, deadline = [], 0, None
+        for part in split_line(line.rstrip(), max_bytes):
+            part_size = len(part.encode()) + 1
+            if batch and max_bytes and size + part_size > max_bytes:
+                yield batch
+                batch, size, deadline = [], 0, None
+            batch.append(part)
+            size += part_size
+            if deadline is None and interval is not None:
+                deadline = time.monotonic() + interval
+            if max_lines and len(batch) >= max_lines:
+                yield batch
+                batch, size, deadline = [], 0, None
+    if batch:
+        yield batch
+
+
+def split_line(line, max_bytes=None):
+    """
+    Split a line in parts of at most `max_bytes` bytes. Empty lines are dropped.
+    """
+    while line:
+        part = line
+        if max_bytes and len(line.encode()) > max_bytes:
+            # Don't split multi-byte characters
+            part = line.encode()[:max_bytes].decode(errors="ignore") or line[0]
+        yield part
+        line = line[len(part) :]
+
+
+def run_command(message_sender, destination_ids, command, username=None):
     command_result = subprocess.check_output(command, shell=True)
     message = "$ " + command + "\n" + command_result.decode("utf-8")
-    messaging.post_message(destination_id, message, pre=True, username=username)
+    for destination_id in destination_ids:
+        message_sender.send(destination_id, message, pre=True, username=username)
 
 
-def send_message(destination, message, pre=False, username=None):
-    destination_id = messaging.get_destination_id(destination)
-    messaging.post_message(destination_id, message, pre=pre, username=username)
+def send_message(message_sender, destination_ids, message, pre=False, username=None):
+    for destination_id in destination_ids:
+        message_sender.send(destination_id, message, pre=pre, username=username)
 
 
-def upload_file(destination, path):
-    destination_id = messaging.get_destination_id(destination)
+def upload_file(destination_id, path):
     messaging.upload_file(path, destination_id)
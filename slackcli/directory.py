@@ -0,0 +1,124 @@
+from . import cache
+from . import names
+
+__all__ = ["find", "name", "add", "refresh", "invalidate"]
+
+# Resource types, by order of precedence on name collisions
+RESOURCE_TYPES = ("channel", "group", "im", "user")
+
+
+class Directory(names.Singleton):
+    """
+    A persistent index of channels, groups, IMs and users, to resolve names to
+    resources without scanning the whole workspace on every call.
+    """
+
+    CACHE_NAME = "directory.json"
+    # Resource fields that are worth persisting
+    FIELDS = ("id", "name", "user")
+
+    def __init__(self):
+        # List of (resource type, resource), by order of precedence
+        self.resources = []
+        # resource name -> [(resource type, resource)], by order of precedence
+        self.name_index = {}
+        # resource id -> resource name
+        self.id_index = {}
+        # True if the directory was fetched from the API during this run
+        self.fresh = False
+        # True if the directory contains all resources, and not just the ones that
+        # were added one by one
+        self.complete = False
+
+        data = cache.load(self.CACHE_NAME)
+        if data:
+            self._index(data.get("resources", []))
+            self.complete = data.get("complete", False)
+
+    def find(self, name, resource_types=RESOURCE_TYPES):
+        """
+        Return the (resource type, resource) tuple associated to a name, or None.
+        Only resources with one of the `resource_types` are considered.
+        """
+        for resource_type, resource in self.name_index.get(name, []):
+            if resource_type in resource_types:
+                return resource_type, resource
+        return None
+
+    def name(self, resource_id, default=None):
+        return self.id_index.get(resource_id, default)
+
+    def refresh(self, resources):
+        """
+        Rebuild the directory from an iterable of (resource type, resource) tuples
+        and persist it to disk. On name collisions, the resource type that comes
+        first in `RESOURCE_TYPES` wins, whatever the order of iteration.
+        """
+        self._index(
+            [
+                (resource_type, {k: resource[k] for k in self.FIELDS if k in resource})
+                for resource_type, resource in resources
+            ]
+        )
+        self.fresh = True
+        self.complete = True
+        self.save()
+
+    def add(self, resource_type, resource):
+        """
+        Add a single resource that was found without listing all resources.
+        """
+        self._index(
+            self.resources
+            + [(resource_type, {k: resource[k] for k in self.FIELDS if k in resource})]
+        )
+        self.save()
+
+    def save(self):
+        cache.save(
+            self.CACHE_NAME, {"resources": self.resources, "complete": self.complete}
+        )
+
+    def invalidate(self):
+        self._index([])
+        self.complete = False
+        cache.remove(self.CACHE_NAME)
+
+    def _index(self, resources):
+        self.resources = [tuple(r) for r in resources]
+        # Sorting is stable, so the API order is preserved within each type
+        self.resources.sort(key=lambda r: RESOURCE_TYPES.index(r[0]))
+        self.name_index = {}
+        self.id_index = {}
+        for resource_type, resource in self.resources:
+            self.name_index.setdefault(resource.get("name"), []).append(
+                (resource_type, resource)
+            )
+            self.id_index.setdefault(resource["id"], resource.get("name"))
+
+
+def find(name, resource_types=RESOURCE_TYPES):
+    return Directory.instance().find(name, resource_types=resource_types)
+
+
+def name(resource_id, default=None):
+    """
+    Find the name of a channel, group, IM or user from its ID, without calling the
+    API.
+    """
+    return Directory.instance().name(resource_id, default=default)
+
+
+def add(resource_type, resource):
+    Directory.instance().add(resource_type, resource)
+
+
+def refresh(resources):
+    Directory.instance().refresh(resources)
+
+
+def invalidate():
+    """
+    Discard the cached directory: it will be fetched again on the next lookup.
+    """
+    Directory.instance().invalidate()
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import json
 import os
+import re
 import urllib.request
 
 
@@ -8,8 +9,8 @@ USE_EMOJIS = "SLACK_CLI_NO_EMOJI" not in os.environ
 
 
 class Emojis:
-    ALL = {}
-    JSON_PATH = os.path.join(os.path.dirname(__file__), "emoji.json")
+    TABLE = None
+    TABLE_PATH = os.path.join(os.path.dirname(__file__), "emoji.tsv")
     URL = "https://raw.githubusercontent.com/iamcal/emoji-data/master/emoji.json"
 
     @classmethod
@@ -17,10 +18,18 @@ class Emojis:
         """
         Get the unicode associated to an emoji name.
         """
-        if not cls.ALL:
-            with open(cls.JSON_PATH) as f:
-                cls.ALL = json.load(f)
-        return cls.ALL.get(name, default)
+        value = cls.index()[name]
+        return default if value is None else value
+
+    @classmethod
+    def index(cls):
+        """
+        Return the short code -> unicode table, which is loaded only once.
+        """
+        table = cls.TABLE
+        if table is None:
+            table = cls.TABLE = EmojiTable(cls.TABLE_PATH)
+        return table
 
     @classmethod
     def download(cls):
@@ -40,40 +49,124 @@ class Emojis:
             utf8 = unified_to_unicode(emoji["unified"])
             for name in emoji["short_names"]:
                 emoji_names[name] = utf8
+        EmojiTable.write(cls.TABLE_PATH, emoji_names)
+
+
+class EmojiTable(dict):
+    """
+    A read-only short code -> unicode table. The table is stored as "name\tunicode"
+    lines, sorted by name, and looked up by binary search in the raw file contents.
+    Thus loading the table does not require any parsing, which is much faster than
+    loading a json dict, and only the emojis that are actually used are decoded.
+
+    Lookups are memoized in the dict itself: `table[name]` returns None for unknown
+    emojis. Unknown names, such as timestamps, are forgotten once there are more
+    than `MAX_MISSES` of them, such that the memo does not grow without bound.
+    """
 
-        with open(cls.JSON_PATH, "w") as f:
-            json.dump(emoji_names, f, sort_keys=True, indent=2)
+    MAX_MISSES = 10000
+
+    def __init__(self, path):
+        super().__init__()
+        with open(path, "rb") as f:
+            self.data = f.read()
+        # Number of memoized unknown names
+        self.misses = 0
+
+    def __missing__(self, name):
+        value = self.lookup(name)
+        if value is None:
+            if self.misses >= self.MAX_MISSES:
+                # Printer workers may look up emojis concurrently
+                for key, known in list(self.items()):
+                    if known is None:
+                        self.pop(key, None)
+                self.misses = 0
+            self.misses += 1
+        self[name] = value
+        return value
+
+    def lookup(self, name):
+        key = name.encode()
+        data = self.data
+        low = 0
+        high = len(data)
+        # Invariant: `low` is the start of a line, and the key is not located
+        # before `low` or after `high`
+        while low < high:
+            # Find the start of the line that contains the middle position
+            line_start = data.rfind(b"\n", low, (low + high) // 2) + 1 or low
+            separator = data.find(b"\t", line_start)
+            line_end = data.find(b"\n", separator)
+            if line_end < 0:
+                line_end = len(data)
+            line_key = data[line_start:separator]
+            if line_key == key:
+                return data[separator + 1 : line_end].decode()
+            if line_key < key:
+                low = line_end + 1
+            else:
+                high = line_start
+        return None
+
+    @staticmethod
+    def write(path, emojis):
+        with open(path, "wb") as f:
+            for name in sorted(emojis, key=lambda n: n.encode()):
+                f.write(name.encode() + b"\t" + emojis[name].encode() + b"\n")
+
+
+# Characters that may change the state of the emojize scanner
+SPECIAL_CHARACTERS = re.compile(r"[`:]")
 
 
 def emojize(text):
     """
     Replace the :short_codes: with their corresponding unicode values. Avoid
     replacing short codes inside verbatim tick (`) marks.
+
+    The text is scanned in a single pass, jumping from one tick or colon to the
+    next (verbatim text is skipped entirely), and the result is assembled from
+    slices of the original text.
     """
-    if not USE_EMOJIS:
+    if not USE_EMOJIS or not text:
         return text
 
+    table = Emojis.index()
+    chunks = []
+    # Start of the text that was not copied to the result yet
+    start = 0
     pos = 0
-    result = ""
     verbatim = False
     verbatim_block = False
-    while pos < len(text):
-        chunk = text[pos]
+    while True:
+        # Jump to the next character that may change the state of the scanner
+        if verbatim_block:
+            pos = text.find("```", pos)
+        elif verbatim:
+            pos = text.find("`", pos)
+        else:
+            match = SPECIAL_CHARACTERS.search(text, pos)
+            pos = match.start() if match else -1
+        if pos < 0:
+            break
         if text[pos] == "`":
             if text[pos + 1 : pos + 3] == "``":
                 verbatim_block = not verbatim_block
             if not verbatim_block:
                 verbatim = not verbatim
-        if text[pos] == ":" and not verbatim and not verbatim_block:
+        else:
             end_pos = text.find(":", pos + 1)
             if end_pos > pos + 1:
-                emoji = Emojis.get(text[pos + 1 : end_pos])
+                emoji = table[text[pos + 1 : end_pos]]
                 if emoji:
-                    chunk = emoji
-                    pos = end_pos
-        result += chunk
+                    chunks.append(text[start:pos])
+                    chunks.append(emoji)
+                    start = pos = end_pos + 1
+                    continue
         pos += 1
-    return result
+    chunks.append(text[start:])
+    return "".join(chunks)
 
 
 def unified_to_unicode(unified):
@@ -4,3 +4,13 @@ class SlackCliError(Exception):
 
 class ConfigSaveError(SlackCliError):
     pass
+
+
+class AlreadyExportedError(SlackCliError):
+    """
+    The conversation was already completely exported to the export file.
+    """
+
+    def __init__(self, count):
+        super().__init__("already exported")
+        self.count = count
@@ -0,0 +1,123 @@
+"""
+Export raw conversation histories to compressed JSON Lines files, one per
+conversation. Exports are checkpointed after every page, such that an interrupted
+export resumes where it stopped.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import json
+import os
+import re
+
+from . import errors
+from . import sender
+from . import slack
+
+__all__ = ["export"]
+
+
+# Maximum number of conversations that are exported concurrently
+WORKERS = 4
+
+
+def export(conversations, directory, workers=WORKERS):
+    """
+    Export (name, conversation id) tuples to `directory`. Return a list of
+    (name, number of exported messages, error) tuples, where the error is None if
+    the conversation was fully exported, and an `errors.AlreadyExportedError` if it
+    had already been fully exported to the same directory. Conversations are
+    exported concurrently, but the API calls of all conversations are throttled
+    together.
+    """
+    bucket = sender.TokenBucket(*sender.RATE_LIMITS["conversations.history"])
+    os.makedirs(directory, exist_ok=True)
+
+    def export_one(conversation):
+        name, conversation_id = conversation
+        path = export_path(directory, name)
+        try:
+            return name, export_conversation(conversation_id, path, bucket), None
+        except errors.AlreadyExportedError as e:
+            return name, e.count, e
+        except slack.BaseError as e:
+            # Other conversations are still exported. An export that failed midway
+            # is resumed by the next export.
+            error = e.response.get("error", e)
+        except OSError as e:
+            error = e
+        return name, load_checkpoint(path + ".checkpoint")["count"], error
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(len(conversations), workers))
+    ) as executor:
+        return list(executor.map(export_one, conversations))
+
+
+def export_path(directory, name):
+    return os.path.join(directory, re.sub(r"[^\w.-]", "_", name) + ".jsonl.gz")
+
+
+def export_conversation(conversation_id, path, bucket):
+    """
+    Write the messages of a conversation to a gzip-compressed JSON Lines file, most
+    recent first, and return the number of messages that were exported.
+
+    Every page of messages is written as a separate gzip member, which is a valid
+    gzip file. After each page, the pagination cursor and the size of the file are
+    saved to a checkpoint file. To resume an interrupted export, the file is
+    truncated to the checkpointed size, which drops any partially written page.
+
+    Complete exports are never modified: newer messages must be exported to a
+    different file. Raise `errors.AlreadyExportedError` if the export is complete.
+    """
+    checkpoint_path = path + ".checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint.get("complete"):
+        raise errors.AlreadyExportedError(checkpoint["count"])
+
+    with open(path, "ab") as export_file:
+        export_file.truncate(checkpoint["size"])
+    cursor = checkpoint["cursor"]
+    count = checkpoint["count"]
+    while True:
+        bucket.acquire()
+        response = slack.call(
+            slack.client().conversations_history,
+            channel=conversation_id,
+            limit=1000,
+            cursor=cursor,
+        )
+        messages = response.get("messages", [])
+        with gzip.open(path, "ab") as export_file:
+            for message in messages:
+                export_file.write(json.dumps(message).encode() + b"\n")
+        count += len(messages)
+        cursor = response.get("response_metadata", {}).get("next_cursor")
+        save_checkpoint(
+            checkpoint_path,
+            {
+                "cursor": cursor,
+                "size": os.path.getsize(path),
+                "count": count,
+                "complete": not cursor,
+            },
+        )
+        if not cursor:
+            return count
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except (IOError, ValueError):
+        # Start from scratch
+        return {"cursor": None, "size": 0, "count": 0}
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(tmp_path, path)
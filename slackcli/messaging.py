@@ -1,7 +1,17 @@
 from __future__ import unicode_literals
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import heapq
+import itertools
+import json
+import queue
 import re
+import tempfile
+import threading
 
+from . import aio
+from . import archive
+from . import directory
 from . import emoji
 from . import errors
 from . import names
@@ -9,93 +19,195 @@ from . import slack
 from . import ui
 
 
+# Slack truncates messages that are longer than 40k characters
+MAX_MESSAGE_BYTES = 40000
+
+
 def get_destination_id(name):
     return get_resource(name)[1]["id"]
 
 
 def get_resource(name):
-    for resource_type, resource in iter_resources():
-        if resource["name"] == name:
-            return resource_type, resource
+    """
+    Find a channel, group, IM or user by name. Names may be prefixed by "#" to search
+    only channels and groups, or by "@" to search only users. Users may also be
+    found by email address, e.g: "@alice@example.com".
+
+    Resources are looked up in the cached directory first. On a cache miss, we
+    search the API again, such that a stale cache does not hide resources that
+    were created since.
+
+    Slack IDs, such as "C0123ABCD", are not looked up at all: they will be validated
+    by the API when they are used.
+    """
+    resource_type = get_id_resource_type(name)
+    if resource_type is not None:
+        return resource_type, {"id": name, "name": directory.name(name, name)}
+
+    resource_types, name = parse_resource_name(name)
+    if resource_types == ("user",) and "@" in name:
+        return get_user_by_email(name)
+
+    found = directory.find(name, resource_types=resource_types)
+    if found is None and not directory.Directory.instance().fresh:
+        if resource_types == directory.RESOURCE_TYPES:
+            refresh_directory()
+            found = directory.find(name)
+        else:
+            found = search_resource(name, resource_types)
+            if found is not None:
+                directory.add(*found)
+    if found is not None:
+        return found
     raise errors.SlackCliError(
         "Channel, group or user '{}' does not exist".format(name)
     )
 
 
-def iter_resources():
-    # Use the modern conversations API which unifies channels, groups, and DMs
-    # Note: Handles pagination to fetch all resources
+# Slack ID prefix -> resource type
+ID_PREFIXES = {"C": "channel", "G": "group", "D": "im", "U": "user", "W": "user"}
 
-    # Public channels
-    try:
-        cursor = None
-        while True:
-            response = slack.client().conversations_list(
-                types="public_channel",
-                limit=500,
-                cursor=cursor
-            )
-            for channel in response.get("channels", []):
-                yield "channel", channel
-
-            # Check for more pages
-            cursor = response.get("response_metadata", {}).get("next_cursor")
-            if not cursor:
-                break
-    except slack.BaseError:
-        pass
 
-    # Private channels (groups)
+def get_id_resource_type(name):
+    """
+    Return the type of resource designated by a Slack ID, or None if the name is not
+    an ID. Channel and user names cannot be uppercase, so there is no ambiguity.
+    """
+    if re.match(r"^[A-Z][A-Z0-9]{8,}$", name):
+        return ID_PREFIXES.get(name[0])
+    return None
+
+
+def parse_resource_name(name):
+    """
+    Return the resource types designated by the name prefix, and the name without
+    prefix.
+    """
+    if name.startswith("#"):
+        return ("channel", "group"), name[1:]
+    if name.startswith("@"):
+        return ("user",), name[1:]
+    return directory.RESOURCE_TYPES, name
+
+
+def search_resource(name, resource_types):
+    """
+    Search a resource by name among the given resource types only, and stop
+    fetching pages as soon as it is found.
+    """
+    for resource_type in resource_types:
+        for page in iter_resource_pages(resource_type):
+            for resource in page:
+                if resource.get("name") == name:
+                    return resource_type, resource
+    return None
+
+
+def get_user_by_email(email):
     try:
-        cursor = None
-        while True:
-            response = slack.client().conversations_list(
-                types="private_channel",
-                limit=500,
-                cursor=cursor
-            )
-            for channel in response.get("channels", []):
-                yield "group", channel
-
-            cursor = response.get("response_metadata", {}).get("next_cursor")
-            if not cursor:
-                break
+        response = slack.client().users_lookupByEmail(email=email)
     except slack.BaseError:
-        pass
+        raise errors.SlackCliError("User '{}' does not exist".format(email))
+    return "user", response["user"]
 
-    # Direct messages - need to add username since DMs don't have a "name" field
-    try:
-        cursor = None
-        while True:
-            response = slack.client().conversations_list(
-                types="im",
-                limit=500,
-                cursor=cursor
-            )
-            for channel in response.get("channels", []):
-                # DMs have a "user" field, we need to get the username
+
+def iter_directory():
+    """
+    Iterate on all (resource type, resource) tuples from the cached directory,
+    which is fetched from the API if it is incomplete.
+    """
+    if not directory.Directory.instance().complete:
+        refresh_directory()
+    return iter(directory.Directory.instance().resources)
+
+
+def refresh_directory():
+    if aio.ENABLED:
+        directory.refresh(aio.run(aio.load_resources()))
+    else:
+        directory.refresh(iter_resources())
+
+
+def iter_resources():
+    """
+    Iterate on (resource type, resource) tuples for all channels, groups, IMs and
+    users. The four lists are paginated independently, so they are fetched
+    concurrently and resources are yielded as soon as their page arrives: the order
+    of the resources is not deterministic across types. The directory resolves name
+    collisions with `directory.RESOURCE_TYPES`.
+
+    Resource types that the token is not allowed to list are skipped. Any other API
+    error is raised, such that a partial list is never taken for a complete one.
+    """
+    pages = queue.Queue()
+    stop = threading.Event()
+
+    def fetch(resource_type):
+        try:
+            for page in iter_resource_pages(resource_type):
+                if stop.is_set():
+                    break
+                pages.put((resource_type, page, None))
+        except slack.BaseError as e:
+            if not slack.is_permission_error(e):
+                pages.put((resource_type, None, e))
+        except Exception as e:  # pylint: disable=broad-except
+            pages.put((resource_type, None, e))
+        finally:
+            pages.put((resource_type, None, None))
+
+    with ThreadPoolExecutor(max_workers=len(directory.RESOURCE_TYPES)) as executor:
+        for resource_type in directory.RESOURCE_TYPES:
+            executor.submit(fetch, resource_type)
+        try:
+            pending = len(directory.RESOURCE_TYPES)
+            while pending:
+                resource_type, page, error = pages.get()
+                if error is not None:
+                    raise error
+                if page is None:
+                    pending -= 1
+                    continue
+                for resource in page:
+                    yield resource_type, resource
+        finally:
+            # Do not fetch any more pages if the consumer stopped iterating
+            stop.set()
+
+
+def iter_resource_pages(resource_type):
+    """
+    Iterate on pages of resources of a single type. We use the conversations API,
+    which unifies channels, groups and DMs.
+    """
+    if resource_type == "channel":
+        yield from slack.iter_pages(
+            slack.client().conversations_list, "channels", types="public_channel"
+        )
+    elif resource_type == "group":
+        yield from slack.iter_pages(
+            slack.client().conversations_list, "channels", types="private_channel"
+        )
+    elif resource_type == "im":
+        # DMs don't have a "name" field: we need to add the username. Usernames are
+        # resolved from the list of all users, which is fetched only once, and
+        # concurrently with the DMs.
+        for page in slack.iter_pages(
+            slack.client().conversations_list, "channels", types="im"
+        ):
+            names.load_users()
+            ims = []
+            for channel in page:
                 if "user" in channel:
                     try:
-                        username = names.username(channel["user"])
-                        channel["name"] = username
+                        channel["name"] = names.username(channel["user"])
                     except:
                         # If we can't get the username, skip this DM
                         continue
-                yield "im", channel
-
-            cursor = response.get("response_metadata", {}).get("next_cursor")
-            if not cursor:
-                break
-    except slack.BaseError:
-        pass
-
-    # Users
-    try:
-        response = slack.client().users_list()
-        for user in response.get("members", []):
-            yield "user", user
-    except slack.BaseError:
-        pass
+                ims.append(channel)
+            yield ims
+    elif resource_type == "user":
+        yield from names.UserIndex.instance().iter_member_pages()
 
 
 def upload_file(path, destination_id):
@@ -106,48 +218,258 @@ def upload_file(path, destination_id):
     )
 
 
-def print_messages(source_name, count=20):
-    resource_type, resource = get_resource(source_name)
+def print_messages(source_name, count=20, newest_first=False, oldest=None, latest=None):
+    """
+    Print the last `count` messages of a conversation, posted between the `oldest`
+    and `latest` timestamps. Messages are printed while they are fetched, such that
+    memory usage is bounded by the size of a single page. With `newest_first`,
+    messages are printed in the order they are returned by the API; otherwise, they
+    are printed in chronological order.
+    """
+    source_name, conversation_id = get_conversation(source_name)
+    messages = iter_conversation_messages(
+        conversation_id, count, newest_first=newest_first, oldest=oldest, latest=latest
+    )
+    for message in messages:
+        print(format_incoming_message(source_name, message))
 
-    # Get the conversation ID
-    conversation_id = resource["id"]
 
-    if resource_type == "user":
-        # For users, we need to find or create a DM conversation
-        response = slack.client().conversations_open(users=resource["id"])
-        conversation_id = response["channel"]["id"]
+def print_timeline(
+    source_names, count=20, newest_first=False, oldest=None, latest=None
+):
+    """
+    Print the last `count` messages of each of multiple conversations, merged in a
+    single timeline.
+    """
+    conversations = [get_conversation(source_name) for source_name in source_names]
+    for (source_name, _), message in iter_timeline(
+        conversations,
+        count=count,
+        newest_first=newest_first,
+        oldest=oldest,
+        latest=latest,
+    ):
+        print(format_incoming_message(source_name, message))
+
 
-    # Use the modern conversations.history API for all conversation types
-    messages = []
-    latest = None
-    while len(messages) < count:
+def iter_timeline(
+    conversations, count=20, newest_first=False, oldest=None, latest=None
+):
+    """
+    Iterate on the last `count` messages of each of multiple (name, conversation id)
+    tuples, as (conversation, message) tuples. Conversations are fetched
+    concurrently, and their messages are merged on the fly by timestamp.
+    """
+    streams = [
+        tag_messages(
+            conversation,
+            iter_in_background(
+                iter_conversation_messages(
+                    conversation[1],
+                    count,
+                    newest_first=newest_first,
+                    oldest=oldest,
+                    latest=latest,
+                )
+            ),
+        )
+        for conversation in conversations
+    ]
+    return merge_timelines(streams, newest_first=newest_first)
+
+
+def iter_conversation_messages(
+    conversation_id, count=None, newest_first=False, oldest=None, latest=None
+):
+    """
+    Iterate on the messages of `iter_conversation_pages`, in chronological order or,
+    with `newest_first`, most recent first.
+    """
+    pages = iter_conversation_pages(
+        conversation_id, count, oldest=oldest, latest=latest
+    )
+    if newest_first:
+        return (message for page in pages for message in page)
+    return iter_chronological(pages)
+
+
+def tag_messages(tag, messages):
+    for message in messages:
+        yield tag, message
+
+
+def merge_timelines(streams, newest_first=False):
+    """
+    Merge iterables of (tag, message) tuples that are each sorted by
+    timestamp, in ascending order or in descending order with `newest_first`.
+    """
+    return heapq.merge(
+        *streams, key=lambda item: float(item[1]["ts"]), reverse=newest_first
+    )
+
+
+def iter_in_background(iterable, maxsize=1000):
+    """
+    Consume an iterable from a background thread, such that multiple slow iterables
+    make progress concurrently. At most `maxsize` items are buffered. The thread
+    starts right away, and not on the first call to `next`: iterables that are
+    consumed one after the other, such as the streams of `merge_timelines`, are
+    still fetched concurrently.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        # Give up if the consumer stopped iterating
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except Exception as e:  # pylint: disable=broad-except
+            put((end, e))
+
+    def consume():
+        try:
+            while True:
+                item, error = items.get()
+                if error is not None:
+                    raise error
+                if item is end:
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    threading.Thread(target=produce, daemon=True).start()
+    return consume()
+
+
+def iter_conversation_pages(conversation_id, count=None, oldest=None, latest=None):
+    """
+    Same as `iter_history_pages`, but read from the local archive when the
+    conversation was archived. Stale archives are synchronized first. User and bot
+    names are prefetched for each page.
+    """
+    if archive.is_archived(conversation_id):
+        if not archive.is_fresh(conversation_id):
+            archive.sync(conversation_id)
+        pages = archive.iter_pages(
+            conversation_id, count=count, oldest=oldest, latest=latest
+        )
+    else:
+        pages = iter_history_pages(conversation_id, count, oldest=oldest, latest=latest)
+    for page in pages:
+        prefetch_names(page)
+        yield page
+
+
+def iter_history_pages(conversation_id, count=None, oldest=None, latest=None):
+    """
+    Iterate on pages of the last `count` messages of a conversation. When `count` is
+    None, all messages are fetched. Only messages posted between the `oldest` and
+    `latest` timestamps are fetched, if specified. Note that messages are sorted by
+    *descending* date (most recent first), both across and within pages.
+    """
+    fetched = 0
+    while count is None or fetched < count:
         response = slack.client().conversations_history(
             channel=conversation_id,
-            limit=min(count - len(messages), 1000),
+            limit=1000 if count is None else min(count - fetched, 1000),
+            oldest=oldest,
             latest=latest,
             inclusive=False,
         )
-        # Note that in the response, messages are sorted by *descending* date
-        # (most recent first)
-        messages += response.get("messages", [])
-        if not response.get("has_more", False):
+        page = response.get("messages", [])
+        if page:
+            yield page
+            fetched += len(page)
+            latest = page[-1]["ts"]
+        if not response.get("has_more", False) or not page:
             break
-        if messages:
-            latest = messages[-1]["ts"]
 
-    # Print the last count messages, from last to first
-    for message in messages[::-1]:
-        print(format_incoming_message(source_name, message))
+
+def iter_chronological(pages):
+    """
+    Iterate on the messages of pages sorted by descending date, from the oldest to
+    the most recent. Pages are spilled to a temporary file, and then read back in
+    reverse order, such that a single page is held in memory at any time.
+    """
+    pages = iter(pages)
+    first_page = next(pages, [])
+    second_page = next(pages, None)
+    if second_page is None:
+        # Single page: no need to go through a file
+        yield from reversed(first_page)
+        return
+
+    offsets = []
+    with tempfile.TemporaryFile() as spill_file:
+        for page in itertools.chain([first_page, second_page], pages):
+            offsets.append(spill_file.tell())
+            spill_file.write(json.dumps(page).encode() + b"\n")
+        for offset in reversed(offsets):
+            spill_file.seek(offset)
+            yield from reversed(json.loads(spill_file.readline()))
+
+
+def get_conversation(source_name):
+    """
+    Return the name and the conversation ID of a channel, group, IM or user.
+    """
+    resource_type, resource = get_resource(source_name)
+    conversation_id = resource["id"]
+    if resource_type == "user":
+        # For users, we need to find or create a DM conversation
+        response = slack.client().conversations_open(users=resource["id"])
+        conversation_id = response["channel"]["id"]
+    return resource.get("name", source_name), conversation_id
+
+
+def prefetch_names(messages):
+    """
+    Resolve all user and bot names referenced by a list of messages in a single
+    concurrent batch, instead of one API call at a time while formatting messages.
+    """
+    user_ids = set()
+    bot_ids = set()
+    for message in messages:
+        if not message.get("username"):
+            if "user" in message:
+                user_ids.add(message["user"])
+            elif "bot_id" in message:
+                bot_ids.add(message["bot_id"])
+        user_ids.update(USER_MENTION_PATTERN.findall(message.get("text", "")))
+    names.prefetch(user_ids=user_ids, bot_ids=bot_ids)
 
 
 def post_message(destination_id, text, pre=False, username=None):
-    if pre:
-        text = "```" + text + "```"
-    else:
+    if not pre:
         status_update_fields = parse_status_update(text)
         if status_update_fields:
             slack.update_status_fields(**status_update_fields)
             return
+    slack.client().chat_postMessage(
+        **message_arguments(destination_id, text, pre=pre, username=username)
+    )
+
+
+def message_arguments(destination_id, text, pre=False, username=None):
+    """
+    Return the chat.postMessage arguments for sending a message.
+    """
+    if pre:
+        text = "```" + text + "```"
     text = format_outgoing_message(text)
 
     # Use the modern chat_postMessage API
@@ -160,7 +482,7 @@ def post_message(destination_id, text, pre=False, username=None):
     if username:
         kwargs["username"] = username
 
-    slack.client().chat_postMessage(**kwargs)
+    return kwargs
 
 
 def parse_status_update(text):
@@ -198,6 +520,9 @@ def format_outgoing_message(message):
     return message
 
 
+USER_MENTION_PATTERN = re.compile(r"\<@([A-Z0-9]+)\>")
+
+
 def format_incoming_message(source_name, message):
     time = datetime.fromtimestamp(float(message["ts"]))
     # Some bots do not have a 'user' entry, but only a 'username'.
@@ -212,10 +537,9 @@ def format_incoming_message(source_name, message):
     text = message["text"]
 
     # Replace user ids by usernames in message text: "<@USLACKBOT>" -> "<@slackbot>"
-    text = re.subn(
-        r"\<@(?P<userid>[A-Z0-9]+)\>",
+    text = USER_MENTION_PATTERN.subn(
         lambda match: "<@{}>".format(
-            names.get_username(match.groupdict()["userid"], match.groupdict()["userid"])
+            names.get_username(match.group(1), match.group(1))
         ),
         text,
     )[0]
@@ -1,3 +1,9 @@
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from . import cache
 from . import slack
 
 
@@ -7,49 +13,241 @@ __all__ = ["username", "sourcename"]
 class Singleton:
 
     INSTANCE = None
+    # Instances may be requested from multiple threads, such as printer workers.
+    # The lock is reentrant, because building an instance may require another one.
+    LOCK = threading.RLock()
 
     @classmethod
     def instance(cls):
         if cls.INSTANCE is None:
-            cls.INSTANCE = cls()
+            with Singleton.LOCK:
+                if cls.INSTANCE is None:
+                    cls.INSTANCE = cls()
         return cls.INSTANCE
 
 
 class UserIndex(Singleton):
-    """An index for storing user names without making too many calls to the API."""
+    """
+    An index for storing user and bot names without making too many calls to the
+    API. The index is persisted to disk, such that names can be resolved without any
+    API call on subsequent runs.
+    """
+
+    CACHE_NAME = "users.json"
+    # Maximum number of concurrent API calls when prefetching names
+    PREFETCH_WORKERS = 8
 
     def __init__(self):
         # user id -> user name
         self.user_id_index = {}
-        # user name -> user id
+        # lowercase user name -> user id
         self.user_name_index = {}
+        # user id -> "updated" timestamp of the user profile
+        self.user_updated = {}
+        # bot id -> bot name
         self.bot_index = {}
+        # True if all users were listed during this run
+        self.loaded = False
+        # Time at which all users were last listed
+        self.listed = 0
+        # True if the persisted list of users is too old to be trusted
+        self.stale = False
+        # True if there are changes that were not persisted yet
+        self.dirty = False
+        # (iterator on pages of users, pages that were fetched so far) of the
+        # listing that is in progress, shared by all callers
+        self.listing = None
+        self.lock = threading.Lock()
+
+        data = cache.load(self.CACHE_NAME, ttl=float("inf"))
+        if data:
+            for user_id, (name, updated) in data.get("users", {}).items():
+                self._add_user(user_id, name, updated)
+            self.bot_index.update(data.get("bots", {}))
+            self.listed = data.get("listed", 0)
+            self.stale = time.time() - self.listed > cache.TTL
 
     def username(self, user_id):
+        if self.stale and not self.loaded:
+            # Pick up renamed users once in a while
+            self.load()
         if user_id not in self.user_id_index:
             response = slack.client().users_info(user=user_id)
-            self.user_id_index[user_id] = response["user"]["name"]
+            self._add_member(response["user"])
         return self.user_id_index[user_id]
 
     def user_id(self, slack_name):
         """
-        Fetch the user ID from the user name. Note that this is really slow, as we need
-        to parse the entire list of user IDs. Unfortunately it is not possible to fetch
-        a user by its username. Ideally, we should cache this list.
+        Fetch the user ID from the user name. Unfortunately it is not possible to
+        fetch a user by its username, so on a cache miss we need to list all users.
         """
-        if not self.user_name_index:
-            response = slack.client().users_list()
-            members = response.get("members", [])
-            for member in members:
-                self.user_name_index[member["name"]] = member["id"]
+        if slack_name.lower() not in self.user_name_index:
+            self.load()
         return self.user_name_index[slack_name.lower()]
 
+    def load(self):
+        """
+        Load all users, with one API call per page of users.
+        """
+        for _page in self.iter_member_pages():
+            pass
+
+    def iter_member_pages(self):
+        """
+        Iterate on pages of users, indexing them on the fly. Users are listed only
+        once per run: concurrent callers share the same listing, and subsequent
+        callers get all users in a single page. Each page is fetched under the lock,
+        but yielded outside of it, such that callers may stop iterating at any time.
+
+        Users are merged in the persisted index based on their "updated" timestamp,
+        and the index is saved only if some users were added or modified. Note that
+        the API does not make it possible to list only the users that were modified
+        since a given time.
+        """
+        listing = page = None
+        with self.lock:
+            if self.loaded and self.listing is None:
+                page = [
+                    {"id": user_id, "name": name}
+                    for user_id, name in self.user_id_index.items()
+                ]
+            else:
+                if self.listing is None:
+                    self.listing = (
+                        slack.iter_pages(slack.client().users_list, "members"),
+                        [],
+                    )
+                listing = self.listing
+        if listing is None:
+            yield page
+            return
+
+        member_pages, pages = listing
+        index = 0
+        while True:
+            with self.lock:
+                if index < len(pages):
+                    # Fetched by another caller: only the id and name are kept
+                    page = pages[index]
+                elif self.listing is not listing:
+                    # The listing is over
+                    return
+                else:
+                    try:
+                        page = next(member_pages, None)
+                    except Exception:
+                        # The next caller starts a new listing
+                        self.listing = None
+                        raise
+                    if page is None:
+                        self.listing = None
+                        self.add_members([], listed=True)
+                        return
+                    self.add_members(page)
+                    pages.append([{"id": m["id"], "name": m["name"]} for m in page])
+            index += 1
+            yield page
+
+    def add_members(self, members, listed=False):
+        """
+        Index users that were fetched from the API. Set `listed` to True once all
+        users were fetched.
+        """
+        for member in members:
+            self._add_member(member)
+        if listed:
+            self.loaded = True
+            self.stale = False
+            self.listed = time.time()
+            self.dirty = True
+            self.save()
+
     def botname(self, bot_id):
         if bot_id not in self.bot_index:
             response = slack.client().bots_info(bot=bot_id)
             self.bot_index[bot_id] = response["bot"]["name"]
+            self.dirty = True
         return self.bot_index[bot_id]
 
+    def prefetch(self, user_ids=(), bot_ids=()):
+        """
+        Resolve the names of many users and bots at once, with concurrent API calls
+        for the ones that are not known yet. Names that cannot be resolved are
+        ignored.
+        """
+        if self.stale and not self.loaded:
+            self.load()
+        unknown = [("user", user_id) for user_id in set(user_ids)]
+        unknown += [("bot", bot_id) for bot_id in set(bot_ids)]
+        unknown = [
+            (kind, slack_id)
+            for kind, slack_id in unknown
+            if slack_id
+            not in (self.user_id_index if kind == "user" else self.bot_index)
+        ]
+        if not unknown:
+            return
+
+        def fetch(kind, slack_id):
+            try:
+                if kind == "user":
+                    return kind, slack.call(slack.client().users_info, user=slack_id)
+                return kind, slack.call(slack.client().bots_info, bot=slack_id)
+            except slack.BaseError:
+                return kind, None
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.PREFETCH_WORKERS, len(unknown))
+        ) as executor:
+            for kind, response in executor.map(lambda args: fetch(*args), unknown):
+                if response is None:
+                    continue
+                if kind == "user":
+                    self._add_member(response["user"])
+                else:
+                    self.bot_index[response["bot"]["id"]] = response["bot"]["name"]
+                    self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        cache.save(
+            self.CACHE_NAME,
+            {
+                "users": {
+                    user_id: (name, self.user_updated.get(user_id, 0))
+                    for user_id, name in self.user_id_index.items()
+                },
+                "bots": self.bot_index,
+                "listed": self.listed,
+            },
+        )
+        self.dirty = False
+
+    def _add_member(self, member):
+        updated = member.get("updated", 0)
+        if member["id"] in self.user_id_index and updated <= self.user_updated.get(
+            member["id"], 0
+        ):
+            # This user did not change
+            return
+        self._add_user(member["id"], member["name"], updated)
+        self.dirty = True
+
+    def _add_user(self, user_id, name, updated):
+        self.user_id_index[user_id] = name
+        self.user_name_index[name.lower()] = user_id
+        self.user_updated[user_id] = updated
+
+
+@atexit.register
+def save_users():
+    """
+    Users that are fetched one by one are persisted only once, at exit.
+    """
+    if UserIndex.INSTANCE is not None:
+        UserIndex.INSTANCE.save()
+
 
 def username(user_id):
     """
@@ -65,6 +263,22 @@ def botname(user_id):
     return UserIndex.instance().botname(user_id)
 
 
+def prefetch(user_ids=(), bot_ids=()):
+    """
+    Resolve the names of many users and bots concurrently, such that subsequent
+    calls to `username` and `botname` do not hit the API.
+    """
+    UserIndex.instance().prefetch(user_ids=user_ids, bot_ids=bot_ids)
+
+
+def load_users():
+    """
+    Load all users at once, such that `username` does not have to call the API for
+    every single user.
+    """
+    UserIndex.instance().load()
+
+
 def get_username(slack_id, default=None):
     """
     Same as `username` but does not raise.
@@ -88,28 +302,61 @@ def get_user_id(slack_name, default=None):
 class SourceIndex(Singleton):
     """
     An index for storing channel/group names without making too many calls to
-    the API.
+    the API. The index starts empty and names are resolved on demand, such that
+    building the index is never on the critical path. It can be warmed up in the
+    background with `warm_up`.
     """
 
     def __init__(self):
         self.source_index = {}
-        # Use the modern conversations API to get DMs
-        response = slack.client().conversations_list(types="im")
-        for im in response.get("channels", []):
-            # For DMs, get the username from the user ID
-            if "user" in im:
-                self.source_index[im["id"]] = username(im["user"])
+        self.lock = threading.Lock()
+        self.warm_up_thread = None
 
     def name(self, source_id):
-        if source_id not in self.source_index:
-            self.source_index[source_id] = self._get_source_name(source_id)
-        return self.source_index[source_id]
+        with self.lock:
+            if source_id in self.source_index:
+                return self.source_index[source_id]
+        source_name = self._get_source_name(source_id)
+        with self.lock:
+            return self.source_index.setdefault(source_id, source_name)
+
+    def warm_up(self):
+        """
+        Load the names of all DMs from a background thread.
+        """
+        with self.lock:
+            if self.warm_up_thread is None:
+                self.warm_up_thread = threading.Thread(
+                    target=self._load_ims, daemon=True
+                )
+                self.warm_up_thread.start()
+
+    def _load_ims(self):
+        # DM names are resolved from the list of all users, which is much cheaper
+        # than one call per DM.
+        try:
+            load_users()
+            for page in slack.iter_pages(
+                slack.client().conversations_list, "channels", types="im"
+            ):
+                im_names = {
+                    im["id"]: username(im["user"]) for im in page if "user" in im
+                }
+                with self.lock:
+                    for source_id, source_name in im_names.items():
+                        self.source_index.setdefault(source_id, source_name)
+        except slack.BaseError:
+            # Names will be resolved on demand
+            pass
 
     @staticmethod
     def _get_source_name(source_id):
         # Use the unified conversations.info API for all conversation types
-        response = slack.client().conversations_info(channel=source_id)
-        return response["channel"]["name"]
+        channel = slack.client().conversations_info(channel=source_id)["channel"]
+        if "name" not in channel and "user" in channel:
+            # DMs don't have a name
+            return username(channel["user"])
+        return channel["name"]
 
 
 def sourcename(source_id):
@@ -117,3 +364,10 @@ def sourcename(source_id):
     Find the source name associated to a source ID.
     """
     return SourceIndex.instance().name(source_id)
+
+
+def warm_up_sources():
+    """
+    Start loading source names in the background.
+    """
+    SourceIndex.instance().warm_up()
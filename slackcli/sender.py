@@ -0,0 +1,169 @@
+import queue
+import random
+import sys
+import threading
+import time
+
+from . import messaging
+from . import slack
+
+__all__ = ["Sender"]
+
+
+# API method -> (requests per second, burst size). These are loosely modelled on the
+# Slack rate limit tiers: https://api.slack.com/docs/rate-limits
+RATE_LIMITS = {
+    # Special tier: about one message per second and per channel, with short bursts
+    "chat.postMessage": (1, 4),
+    # Tier 3: 50 requests per minute
+    "users.profile.set": (50 / 60, 5),
+    "conversations.history": (50 / 60, 5),
+}
+
+
+class TokenBucket:
+    """
+    Allow `rate` operations per second on average, with bursts of `capacity`
+    operations.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until an operation is allowed.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.timestamp) * self.rate
+                )
+                self.timestamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class Sender:
+    """
+    Send messages from background threads, such that reading input is not blocked
+    by the Slack API. Messages are throttled according to the Slack rate limits,
+    retried when they are rate-limited anyway, and delivered in order for each
+    destination.
+
+    Usage:
+
+        with Sender() as sender:
+            sender.send(destination_id, text)
+    """
+
+    def __init__(self, workers=1, queue_size=1000, max_retries=5):
+        self.max_retries = max_retries
+        # Each destination is always handled by the same worker, which guarantees
+        # ordered delivery per destination.
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.threads = [
+            threading.Thread(target=self._work, args=(q,), daemon=True)
+            for q in self.queues
+        ]
+        # destination id -> worker queue
+        self.assignments = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        # destination id -> last delivery error
+        self.errors = {}
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def send(self, destination_id, text, pre=False, username=None):
+        """
+        Queue a message for delivery. This blocks when the queue is full.
+        """
+        if destination_id not in self.assignments:
+            # Spread destinations evenly across workers
+            self.assignments[destination_id] = self.queues[
+                len(self.assignments) % len(self.queues)
+            ]
+        self.assignments[destination_id].put((destination_id, text, pre, username))
+
+    def close(self):
+        """
+        Wait until all queued messages are processed.
+        """
+        for worker_queue in self.queues:
+            worker_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def summary(self):
+        return "{} sent, {} retried, {} dropped".format(
+            self.sent, self.retried, self.dropped
+        )
+
+    def _work(self, worker_queue):
+        while True:
+            item = worker_queue.get()
+            if item is None:
+                break
+            self._deliver(*item)
+
+    def _deliver(self, destination_id, text, pre, username):
+        method = "chat.postMessage"
+        if not pre and messaging.parse_status_update(text):
+            method = "users.profile.set"
+        bucket = self._bucket(method, destination_id)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                messaging.post_message(destination_id, text, pre=pre, username=username)
+            except slack.BaseError as e:
+                delay = slack.retry_after(e)
+                if delay is None or attempt >= self.max_retries:
+                    self._drop(destination_id, e.response.get("error", e))
+                    return
+                with self.lock:
+                    self.retried += 1
+                attempt += 1
+                # Add some jitter, such that workers don't all retry at once
+                time.sleep(delay + random.uniform(0, 1))
+            except Exception as e:  # pylint: disable=broad-except
+                self._drop(destination_id, e)
+                return
+            else:
+                with self.lock:
+                    self.sent += 1
+                return
+
+    def _drop(self, destination_id, error):
+        with self.lock:
+            self.dropped += 1
+            self.errors[destination_id] = error
+        sys.stderr.write(
+            "❌ Could not send message to {}: {}\n".format(destination_id, error)
+        )
+
+    def _bucket(self, method, destination_id):
+        # Message rate limits apply per channel, other limits per method
+        key = (method, destination_id if method == "chat.postMessage" else None)
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(*RATE_LIMITS[method])
+            return self.buckets[key]
@@ -1,25 +1,37 @@
-import json
-import re
+import atexit
+import os
+import random
 import sys
+import time
 
-from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
 from . import errors
 from . import token
-from . import messaging
+from . import transport
 
 __all__ = ["client", "init"]
 
 
 BaseError = SlackApiError
 
+# Optional HTTP(S) proxy URL. When undefined, the standard HTTPS_PROXY environment
+# variable is used.
+PROXY = os.environ.get("SLACK_CLI_PROXY")
+# Print HTTP connection statistics on exit
+DEBUG = "SLACK_CLI_DEBUG" in os.environ
+
 
 class SlackClient:
     INSTANCE = None
 
+    # Maximum number of concurrent connections of the asyncio client
+    MAX_ASYNC_CONNECTIONS = 100
+
     def __init__(self, user_token):
-        self._web_client = WebClient(token=user_token)
+        # All API calls from all modules share the same pool of keep-alive connections
+        self._web_client = transport.PooledWebClient(token=user_token, proxy=PROXY)
+        self._async_web_client = None
 
     @classmethod
     def create_instance(cls, user_token):
@@ -32,6 +44,32 @@ class SlackClient:
             raise ValueError("Slack client token was not defined")
         return cls.INSTANCE
 
+    def async_client(self):
+        """
+        Return an asyncio client for the same token. All calls share the same
+        aiohttp session, which is created on first use and must be closed with
+        `close_async_client`. This requires the aiohttp package.
+        """
+        if self._async_web_client is None:
+            # pylint: disable=import-outside-toplevel
+            import aiohttp
+            from slack_sdk.web.async_client import AsyncWebClient
+
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.MAX_ASYNC_CONNECTIONS)
+            )
+            self._async_web_client = AsyncWebClient(
+                token=self._web_client.token,
+                session=session,
+                proxy=self._web_client.proxy,
+            )
+        return self._async_web_client
+
+    async def close_async_client(self):
+        if self._async_web_client is not None:
+            await self._async_web_client.session.close()
+            self._async_web_client = None
+
     # Provide access to the WebClient for direct API calls
     def __getattr__(self, name):
         return getattr(self._web_client, name)
@@ -70,6 +108,7 @@ def save_token(user_token, team=None):
     try:
         response = client().team_info()
         team = team or response["team"]["domain"]
+        team_id = response["team"]["id"]
     except SlackApiError as e:
         message = str(e)
         if e.response.get("error") == "missing_scope":
@@ -80,7 +119,7 @@ def save_token(user_token, team=None):
 
     # Save token
     try:
-        token.save(user_token, team)
+        token.save(user_token, team, team_id=team_id)
     except errors.ConfigSaveError as e:
         sys.stderr.write("❌ ")
         sys.stderr.write(e.args[0])
@@ -95,5 +134,75 @@ def client():
     return SlackClient.instance()
 
 
+@atexit.register
+def print_stats():
+    if DEBUG and SlackClient.INSTANCE is not None:
+        sys.stderr.write(
+            "🔌 {}\n".format(SlackClient.INSTANCE._web_client.pool.stats())
+        )
+
+
+def async_client():
+    """
+    Asyncio counterpart of `client`. Must be called from a running event loop.
+    """
+    return SlackClient.instance().async_client()
+
+
+def call(method, max_retries=5, **kwargs):
+    """
+    Call an API method, and retry after the delay requested by the API whenever the
+    call is rate-limited. A bit of jitter is added to the delay, such that
+    concurrent calls do not all retry at the same time.
+    """
+    attempt = 0
+    while True:
+        try:
+            return method(**kwargs)
+        except SlackApiError as e:
+            delay = retry_after(e)
+            if delay is None or attempt >= max_retries:
+                raise
+        attempt += 1
+        time.sleep(delay + random.uniform(0, 1))
+
+
+def retry_after(error):
+    """
+    Return the number of seconds to wait before retrying a rate-limited call, or
+    None if the error is not a rate limit error.
+    """
+    if error.response is None or error.response.status_code != 429:
+        return None
+    headers = error.response.headers or {}
+    return float(headers.get("Retry-After", headers.get("retry-after", 1)))
+
+
+def is_permission_error(error):
+    """
+    Return True if an API error means that the token is not allowed to call the
+    method, for instance because it lacks a scope.
+    """
+    return error.response is not None and error.response.get("error") in (
+        "missing_scope",
+        "not_allowed_token_type",
+        "no_permission",
+    )
+
+
+def iter_pages(method, key, limit=500, **kwargs):
+    """
+    Iterate on the pages of a paginated API method. Each page is the list of items
+    stored in the `key` field of the response. Rate-limited calls are retried.
+    """
+    cursor = None
+    while True:
+        response = call(method, limit=limit, cursor=cursor, **kwargs)
+        yield response.get(key, [])
+        cursor = response.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            break
+
+
 def update_status_fields(**profile):
     client().users_profile_set(profile=profile)
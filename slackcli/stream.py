@@ -1,3 +1,10 @@
+import collections
+import json
+import sys
+import tempfile
+import threading
+import time
+
 from slack_sdk.socket_mode import SocketModeClient
 from slack_sdk.socket_mode.response import SocketModeResponse
 from slack_sdk.socket_mode.request import SocketModeRequest
@@ -9,26 +16,102 @@ from . import messaging
 from . import token as token_module
 
 
-def receive(sources):
+# Number of threads that format and print incoming messages
+WORKERS = 4
+# Maximum number of events that are held in memory by each worker
+QUEUE_SIZE = 1000
+# What to do with new events when a worker queue is full: wait until there is room
+# in the queue, drop the oldest event, or write events to disk until the worker
+# catches up.
+OVERFLOW_POLICIES = ("block", "drop-oldest", "spill")
+
+
+def receive(sources, overflow="block", last=None, since=None):
     try:
-        loop(sources)
+        loop(sources, overflow=overflow, last=last, since=since)
     except KeyboardInterrupt:
         pass
 
 
-def loop(sources):
+def loop(sources, overflow="block", last=None, since=None):
+    """
+    Stream messages from the sources. When `last` or `since` are specified, the
+    last messages are printed first (see `messaging.print_messages`), followed by
+    the new messages, without any gap or duplicate.
+    """
     # Get the app-level token for Socket Mode
     app_token = token_module.load_app_token()
     if not app_token:
         app_token = token_module.ask_app_token()
         token_module.save_app_token(app_token)
 
-    # Initialize Socket Mode client
+    # Initialize Socket Mode client. Listeners are run by a single thread, such that
+    # events are submitted to the printer in the order they are received: they
+    # only acknowledge and queue events, which is fast.
     socket_client = SocketModeClient(
         app_token=app_token,
-        web_client=slack.client()._web_client
+        web_client=slack.client()._web_client,
+        concurrency=1,
     )
 
+    # Resolve sources once: events from other conversations are then discarded
+    # without any API call.
+    source_names = resolve_sources(sources)
+    source_ids = None if source_names is None else frozenset(source_names)
+    if source_ids is None:
+        # Names of all sources are required: load them while connecting
+        names.warm_up_sources()
+
+    follow = last is not None or since is not None
+    # (channel, ts) of the messages that were printed before streaming
+    printed_keys = set()
+
+    def print_message(event):
+        channel_id = event["channel"]
+        if (channel_id, event["ts"]) in printed_keys:
+            return None
+        if source_ids is None:
+            source_name = names.sourcename(channel_id)
+        else:
+            source_name = source_names[channel_id]
+        return messaging.format_incoming_message(source_name, event)
+
+    # When following, live events are held until the last messages are printed
+    printer = Printer(print_message, overflow=overflow, paused=follow)
+    backfill = Backfill(source_ids or ())
+
+    def recover_missed_messages():
+        gap = backfill.gap()
+        count = 0
+        try:
+            for event in backfill.iter_missed():
+                printer.submit(event, hold=False)
+                count += 1
+        except slack.BaseError as e:
+            sys.stderr.write("❌ Could not recover missed messages: {}\n".format(e))
+        finally:
+            # Live events that were received in the meantime are printed after the
+            # missed messages
+            printer.release()
+        sys.stderr.write(
+            "⚠️ Reconnected{}: {} missed messages recovered\n".format(
+                "" if gap is None else " after {:.1f}s".format(gap), count
+            )
+        )
+
+    def process_raw_message(raw_message):
+        # A "hello" message is received on every (re)connection. Raw messages are
+        # processed in the order they are received, such that the "hello" message
+        # is processed before the events of the new connection.
+        if (
+            '"hello"' not in raw_message
+            or json.loads(raw_message).get("type") != "hello"
+        ):
+            return
+        if backfill.connected():
+            printer.hold()
+            threading.Thread(target=recover_missed_messages, daemon=True).start()
+
     def process_message(client: SocketModeClient, req: SocketModeRequest):
         # Acknowledge the request immediately
         response = SocketModeResponse(envelope_id=req.envelope_id)
@@ -41,21 +124,396 @@ def loop(sources):
             # Filter for message events (no subtype means it's a regular message)
             if event.get("type") == "message" and "subtype" not in event:
                 channel_id = event.get("channel")
-                if channel_id:
-                    source_name = names.sourcename(channel_id)
-                    if source_name in sources or "all" in sources:
-                        print(messaging.format_incoming_message(source_name, event))
+                if (
+                    channel_id
+                    and (source_ids is None or channel_id in source_ids)
+                    and backfill.add(event)
+                ):
+                    # Name resolution and formatting may call the API: they are
+                    # performed by the printer workers, such that the listener
+                    # can process the next events right away.
+                    printer.submit(event)
 
-    # Register the message handler
+    # Register the message handlers
     socket_client.socket_mode_request_listeners.append(process_message)
+    socket_client.on_message_listeners.append(process_raw_message)
+    socket_client.on_close_listeners.append(backfill.disconnected)
 
-    # Connect and keep the connection alive
-    socket_client.connect()
-
-    # Block until interrupted
-    from time import sleep
     try:
+        # Connect and keep the connection alive
+        socket_client.connect()
+
+        if follow:
+            # The connection is established first, such that messages that are
+            # posted while the history is fetched are not lost
+            for (source_name, conversation_id), message in messaging.iter_timeline(
+                [
+                    (name, conversation_id)
+                    for conversation_id, name in source_names.items()
+                ],
+                count=last,
+                oldest=since,
+            ):
+                print(messaging.format_incoming_message(source_name, message))
+                printed_keys.add((conversation_id, message["ts"]))
+                backfill.add(dict(message, channel=conversation_id))
+            printer.resume()
+
+        # Block until interrupted
         while True:
-            sleep(1)
+            time.sleep(1)
     finally:
         socket_client.close()
+        printer.close()
+        if printer.dropped or slack.DEBUG:
+            sys.stderr.write("📊 {}\n".format(printer.summary()))
+
+
+def resolve_sources(sources):
+    """
+    Return the {conversation id: name} dict of the requested sources, or None if all
+    sources were requested.
+    """
+    if "all" in sources:
+        return None
+    return {
+        conversation_id: name
+        for name, conversation_id in map(messaging.get_conversation, sources)
+    }
+
+
+class Backfill:
+    """
+    Keep track of the last message of each conversation, to fetch the messages that
+    were missed while the connection was down. Messages are identified by their
+    (channel, ts) tuple, such that messages that are both fetched and received live
+    are only printed once.
+    """
+
+    def __init__(self, channel_ids=(), capacity=10000):
+        self.lock = threading.Lock()
+        # Conversations that have no message yet are backfilled from now on
+        now = "{:.6f}".format(time.time())
+        # channel id -> ts of the last message
+        self.last_ts = dict.fromkeys(channel_ids, now)
+        # Recent (channel, ts) tuples, up to `capacity`
+        self.seen = collections.OrderedDict()
+        self.capacity = capacity
+        self.connections = 0
+        self.disconnections = 0
+        self.disconnected_at = None
+        # Duration of the last disconnection, and channel id -> ts of the last message
+        # before the disconnection
+        self.last_gap = None
+        self.missed_since = None
+
+    def add(self, event):
+        """
+        Record a message. Return False if the message was already recorded.
+        """
+        channel_id, ts = event["channel"], event["ts"]
+        with self.lock:
+            if (channel_id, ts) in self.seen:
+                return False
+            self.seen[(channel_id, ts)] = None
+            if len(self.seen) > self.capacity:
+                self.seen.popitem(last=False)
+            if ts > self.last_ts.get(channel_id, ""):
+                self.last_ts[channel_id] = ts
+            return True
+
+    def connected(self):
+        """
+        Record a new connection. Return True if this is a reconnection, in which case
+        the last message of each conversation is saved as the start of the gap.
+
+        This must be called before any event of the new connection is recorded:
+        otherwise, live events and redelivered events would hide the messages that
+        were posted while the connection was down.
+        """
+        with self.lock:
+            self.connections += 1
+            if self.connections == 1:
+                return False
+            if self.missed_since is None:
+                # Otherwise, the previous gap was not backfilled yet, and starts
+                # earlier
+                self.missed_since = dict(self.last_ts)
+            self.last_gap = (
+                None
+                if self.disconnected_at is None
+                else time.time() - self.disconnected_at
+            )
+            self.disconnected_at = None
+            return True
+
+    def disconnected(self, *_args):
+        """
+        Record the end of a connection. slack_sdk may report it after the next
+        connection was established: the disconnection is then ignored.
+        """
+        with self.lock:
+            self.disconnections += 1
+            if self.disconnections == self.connections:
+                self.disconnected_at = time.time()
+
+    def gap(self):
+        """
+        Return the duration of the last disconnection, in seconds, or None if it is
+        unknown.
+        """
+        with self.lock:
+            last_gap, self.last_gap = self.last_gap, None
+        return last_gap
+
+    def iter_missed(self):
+        """
+        Iterate on the messages that were posted after the last recorded message of
+        each conversation before the last disconnection, and that were not recorded
+        yet, in chronological order.
+        """
+        with self.lock:
+            missed_since, self.missed_since = self.missed_since, None
+        for channel_id, oldest in (missed_since or {}).items():
+            pages = messaging.iter_history_pages(channel_id, oldest=oldest)
+            for message in messaging.iter_chronological(pages):
+                # Same filter as live events
+                if "subtype" in message:
+                    continue
+                event = dict(message, channel=channel_id)
+                if self.add(event):
+                    yield event
+
+
+class Printer:
+    """
+    Format and print events from a pool of worker threads. Events of the same
+    channel are always handled by the same worker, such that they are printed in
+    the order they were received.
+
+    The `format_event` function returns the text to print for an event, or None if
+    the event should be ignored.
+
+    Submitted events can be held, for instance while missed events are fetched: the
+    missed events are submitted with `hold=False`, and held events are submitted
+    after them, on `release`.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        format_event,
+        workers=WORKERS,
+        queue_size=QUEUE_SIZE,
+        overflow="block",
+        paused=False,
+    ):
+        self.format_event = format_event
+        # Events are queued, but not processed, until the printer is resumed
+        self.running = threading.Event()
+        if not paused:
+            self.running.set()
+        self.queues = [EventQueue(queue_size, overflow) for _ in range(workers)]
+        self.threads = [
+            threading.Thread(target=self._work, args=(q,), daemon=True)
+            for q in self.queues
+        ]
+        # channel id -> worker queue
+        self.assignments = {}
+        # Events that are held until release, and number of pending holds
+        self.held = []
+        self.holds = 0
+        # Serializes submissions. This is not `self.lock`, which is acquired by
+        # workers to print, because a submission may wait for a worker.
+        self.submit_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.printed = 0
+        self.failed = 0
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, event, hold=True):
+        with self.submit_lock:
+            if hold and self.holds:
+                self.held.append(event)
+            else:
+                self._put(event)
+
+    def hold(self):
+        """
+        Hold submitted events until `release` is called, as many times as `hold`.
+        """
+        with self.submit_lock:
+            self.holds += 1
+
+    def release(self):
+        with self.submit_lock:
+            self.holds -= 1
+            if not self.holds:
+                held, self.held = self.held, []
+                for event in held:
+                    self._put(event)
+
+    def resume(self):
+        self.running.set()
+
+    def close(self):
+        """
+        Stop the workers, without waiting for pending events.
+        """
+        for event_queue in self.queues:
+            event_queue.close()
+
+    @property
+    def depth(self):
+        return sum(q.depth for q in self.queues)
+
+    @property
+    def max_depth(self):
+        return max(q.max_depth for q in self.queues)
+
+    @property
+    def dropped(self):
+        return sum(q.dropped for q in self.queues)
+
+    @property
+    def spilled(self):
+        return sum(q.spilled for q in self.queues)
+
+    def summary(self):
+        return (
+            "{} printed, {} failed, {} dropped, {} spilled to disk,"
+            " {} pending (max. {} per worker)"
+        ).format(
+            self.printed,
+            self.failed,
+            self.dropped,
+            self.spilled,
+            self.depth,
+            self.max_depth,
+        )
+
+    def _put(self, event):
+        channel_id = event["channel"]
+        if channel_id not in self.assignments:
+            # Spread channels evenly across workers
+            self.assignments[channel_id] = self.queues[
+                len(self.assignments) % len(self.queues)
+            ]
+        self.assignments[channel_id].put(event)
+
+    def _work(self, event_queue):
+        self.running.wait()
+        while True:
+            event = event_queue.get()
+            if event is None:
+                break
+            try:
+                text = self.format_event(event)
+            except Exception as e:  # pylint: disable=broad-except
+                # A single faulty event must not stop the stream
+                with self.lock:
+                    self.failed += 1
+                sys.stderr.write("❌ Could not print message: {}\n".format(e))
+                continue
+            if text is None:
+                continue
+            with self.lock:
+                # Printing under the lock guarantees that lines are not interleaved
+                print(text, flush=True)
+                self.printed += 1
+
+
+class EventQueue:
+    """
+    A bounded FIFO queue of JSON-serializable events, with an overflow policy:
+
+    - "block": `put` waits until there is room in the queue.
+    - "drop-oldest": the oldest event is dropped to make room for the new one.
+    - "spill": events are written to a temporary file when the queue is full, and
+      read back, in order, when there is room again.
+    """
+
+    def __init__(self, maxsize=QUEUE_SIZE, overflow="block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise errors.SlackCliError("Invalid overflow policy: '{}'".format(overflow))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        # Spilled events are read from the spill file between these offsets
+        self.spill_file = None
+        self.spill_read_offset = 0
+        self.spill_write_offset = 0
+        self.spill_pending = 0
+        # Counters
+        self.dropped = 0
+        self.spilled = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        return len(self.items) + self.spill_pending
+
+    def put(self, event):
+        with self.condition:
+            if self.overflow == "spill" and (
+                self.spill_pending or len(self.items) >= self.maxsize
+            ):
+                # Once events are spilled, newer events must be spilled too, to
+                # preserve their order
+                self._spill(event)
+            else:
+                while self.overflow == "block" and len(self.items) >= self.maxsize:
+                    if self.closed:
+                        return
+                    self.condition.wait()
+                if len(self.items) >= self.maxsize:
+                    self.items.popleft()
+                    self.dropped += 1
+                self.items.append(event)
+            self.max_depth = max(self.max_depth, self.depth)
+            self.condition.notify_all()
+
+    def get(self):
+        """
+        Return the oldest event, or None if the queue was closed.
+        """
+        with self.condition:
+            while not self.items and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return None
+            event = self.items.popleft()
+            self._unspill()
+            self.condition.notify_all()
+            return event
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            if self.spill_file is not None:
+                self.spill_file.close()
+            self.condition.notify_all()
+
+    def _spill(self, event):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile()
+        self.spill_file.seek(self.spill_write_offset)
+        self.spill_file.write(json.dumps(event).encode() + b"\n")
+        self.spill_write_offset = self.spill_file.tell()
+        self.spill_pending += 1
+        self.spilled += 1
+
+    def _unspill(self):
+        # Move spilled events back to memory, as long as there is room
+        while self.spill_pending and len(self.items) < self.maxsize:
+            self.spill_file.seek(self.spill_read_offset)
+            self.items.append(json.loads(self.spill_file.readline()))
+            self.spill_read_offset = self.spill_file.tell()
+            self.spill_pending -= 1
+        if not self.spill_pending and self.spill_file is not None:
+            # Reuse the file from the start
+            self.spill_file.truncate(0)
+            self.spill_read_offset = self.spill_write_offset = 0
@@ -75,9 +75,9 @@ Your Slack API token{}: """.format(
     return token
 
 
-def save(token, team):
+def save(token, team, team_id=None):
     save_default(token)
-    save_team(token, team)
+    save_team(token, team, team_id=team_id)
 
 
 def save_default(token):
@@ -87,18 +87,60 @@ def save_default(token):
     os.chmod(TOKEN_PATH, stat.S_IREAD | stat.S_IWRITE)
 
 
-def save_team(token, team):
-    ensure_directory_exists(TOKEN_PATH)
-    teams = {}
+def save_team(token, team, team_id=None):
+    teams = load_teams()
+    teams[team] = {"token": token}
+    if team_id:
+        teams[team]["team_id"] = team_id
+    save_teams(teams)
+
+
+def load_teams():
     if os.path.exists(TEAMS_PATH):
         with open(TEAMS_PATH) as teams_file:
-            teams = json.load(teams_file)
-    teams[team] = {"token": token}
+            return json.load(teams_file)
+    return {}
+
+
+def save_teams(teams):
+    ensure_directory_exists(TOKEN_PATH)
     with open(TEAMS_PATH, "w") as teams_file:
         json.dump(teams, teams_file, sort_keys=True, indent=4)
     os.chmod(TEAMS_PATH, stat.S_IREAD | stat.S_IWRITE)
 
 
+def load_team_id(token):
+    """
+    Return the ID of the team of a token that was saved with its team ID, or None.
+    """
+    try:
+        teams = load_teams()
+    except (IOError, ValueError):
+        return None
+    for team in teams.values():
+        if team.get("token") == token and team.get("team_id"):
+            return team["team_id"]
+    return None
+
+
+def save_team_id(token, team_id):
+    """
+    Save the team ID next to the token in the teams file, if the token was saved
+    there. Failing to do so is not an error.
+    """
+    try:
+        teams = load_teams()
+        saved = False
+        for team in teams.values():
+            if team.get("token") == token:
+                team["team_id"] = team_id
+                saved = True
+        if saved:
+            save_teams(teams)
+    except (IOError, ValueError, errors.ConfigSaveError):
+        pass
+
+
 def ensure_directory_exists(path):
     directory = os.path.dirname(path)
     if not os.path.exists(directory):
@@ -0,0 +1,193 @@
+"""
+Keep-alive HTTP transport for the synchronous Slack client. By default, the
+slack_sdk WebClient opens a new HTTPS connection, TLS handshake included, for every
+API call. Here, connections are kept open and reused across calls and threads.
+"""
+
+import base64
+import http.client
+import io
+import os
+import ssl
+import threading
+import urllib.parse
+from urllib.error import HTTPError
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackRequestError
+
+__all__ = ["PooledWebClient", "ConnectionPool"]
+
+
+# Maximum number of idle connections that are kept open, per host
+POOL_SIZE = int(os.environ.get("SLACK_CLI_POOL_SIZE", 10))
+
+# Errors that are raised when the server closed an idle keep-alive connection
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of keep-alive HTTP(S) connections. Each request checks out an
+    idle connection to the target host, or opens a new one, and returns it to the
+    pool once the response has been read. All HTTPS connections share the same SSL
+    context, such that TLS sessions can be resumed.
+    """
+
+    def __init__(self, size=POOL_SIZE, proxy=None, ssl_context=None, timeout=30):
+        self.size = size
+        self.proxy = urllib.parse.urlsplit(proxy) if proxy else None
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.timeout = timeout
+        # (scheme, host, port) -> list of idle connections
+        self.idle = {}
+        self.lock = threading.Lock()
+        # Counters, to check that connections are actually reused
+        self.connections = 0
+        self.requests = 0
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Perform a request and return the (status, reason, headers, body) of the
+        response. A reused connection that was closed by the server is replaced by a
+        new one, once.
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        if self.proxy and parts.scheme == "http":
+            # Plain HTTP proxies expect absolute URLs
+            path = url
+
+        with self.lock:
+            self.requests += 1
+        connection, reused = self._checkout(key)
+        while True:
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                data = response.read()
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                if not reused:
+                    raise
+                # The server closed the idle connection before reading the request
+                connection, reused = self._connect(key), False
+                continue
+            except Exception:
+                connection.close()
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+        return response.status, response.reason, response.msg, data
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def stats(self):
+        return "{} HTTP requests, {} connections opened".format(
+            self.requests, self.connections
+        )
+
+    def _checkout(self, key):
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                return connections.pop(), True
+        return self._connect(key), False
+
+    def _checkin(self, key, connection):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.size:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def _connect(self, key):
+        scheme, host, port = key
+        with self.lock:
+            self.connections += 1
+        if self.proxy:
+            connection = self._connection_class(scheme)(
+                self.proxy.hostname, self.proxy.port, **self._connection_kwargs(scheme)
+            )
+            if scheme == "https":
+                connection.set_tunnel(host, port, headers=self._proxy_headers())
+            return connection
+        return self._connection_class(scheme)(
+            host, port, **self._connection_kwargs(scheme)
+        )
+
+    def _proxy_headers(self):
+        if not self.proxy.username:
+            return None
+        credentials = "{}:{}".format(
+            urllib.parse.unquote(self.proxy.username),
+            urllib.parse.unquote(self.proxy.password or ""),
+        )
+        return {
+            "Proxy-Authorization": "Basic "
+            + base64.b64encode(credentials.encode()).decode()
+        }
+
+    def _connection_class(self, scheme):
+        if scheme == "https":
+            return http.client.HTTPSConnection
+        return http.client.HTTPConnection
+
+    def _connection_kwargs(self, scheme):
+        kwargs = {"timeout": self.timeout}
+        if scheme == "https":
+            kwargs["context"] = self.ssl_context
+        return kwargs
+
+
+class PooledWebClient(WebClient):
+    """
+    A WebClient that sends all API calls through a shared `ConnectionPool`. The
+    `proxy` and `ssl` arguments of the WebClient are honoured.
+    """
+
+    def __init__(self, *args, pool_size=POOL_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        proxy = self.proxy
+        if proxy is not None and not isinstance(proxy, str):
+            raise SlackRequestError(
+                "Invalid proxy detected: {} must be a str value".format(proxy)
+            )
+        self.pool = ConnectionPool(
+            size=pool_size,
+            proxy=proxy or None,
+            ssl_context=self.ssl,
+            timeout=self.timeout,
+        )
+
+    def _perform_urllib_http_request_internal(self, url, req):
+        # Same contract as the parent method, which is based on urlopen
+        if not url.lower().startswith("http"):
+            raise SlackRequestError("Invalid URL detected: {}".format(url))
+        status, reason, headers, body = self.pool.request(
+            req.get_method(), url, body=req.data, headers=dict(req.header_items())
+        )
+        if status >= 400:
+            raise HTTPError(url, status, reason, headers, io.BytesIO(body))
+        if headers.get_content_type() != "application/gzip":
+            # Binary responses are returned as-is, such as admin.analytics.getFile
+            body = body.decode(headers.get_content_charset() or "utf-8")
+        return {"status": status, "headers": headers, "body": body}
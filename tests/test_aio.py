@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from slackcli import aio
+from slackcli import names
+
+
+@patch.object(names.cache, "save")
+@patch.object(names.cache, "load", return_value=None)
+@patch.object(aio.slack, "client")
+@patch.object(aio.slack, "async_client")
+class AioTests(unittest.TestCase):
+    def setUp(self):
+        names.UserIndex.INSTANCE = None
+
+    def tearDown(self):
+        names.UserIndex.INSTANCE = None
+
+    def test_load_resources(self, mock_async_client, mock_client, *_mocks):
+        mock_client.return_value.close_async_client = AsyncMock()
+        client = MagicMock()
+        mock_async_client.return_value = client
+
+        conversations = {
+            "public_channel": {"channels": [{"id": "C1", "name": "general"}]},
+            "private_channel": {"channels": [{"id": "G1", "name": "secret"}]},
+            "im": {"channels": [{"id": "D1", "user": "U1"}]},
+        }
+        client.conversations_list = AsyncMock(
+            side_effect=lambda types, **kwargs: conversations[types]
+        )
+        client.users_list = AsyncMock(
+            return_value={"members": [{"id": "U1", "name": "alice"}]}
+        )
+
+        resources = aio.run(aio.load_resources())
+        self.assertEqual(
+            [
+                ("channel", "general"),
+                ("group", "secret"),
+                ("im", "alice"),
+                ("user", "alice"),
+            ],
+            [(t, r["name"]) for t, r in resources],
+        )
+        # The session is closed at the end of the run
+        mock_client.return_value.close_async_client.assert_awaited_once()
+        # DM names were resolved from the user list
+        mock_client.return_value.users_info.assert_not_called()
+
+    def test_post_messages_reports_errors(self, mock_async_client, mock_client, *_):
+        mock_client.return_value.close_async_client = AsyncMock()
+        client = MagicMock()
+        mock_async_client.return_value = client
+        response = MagicMock(status_code=404, headers={})
+        response.get.return_value = "channel_not_found"
+        error = aio.slack.BaseError("channel_not_found", response)
+
+        async def post_message(channel, **_kwargs):
+            if channel == "C2":
+                raise error
+
+        client.chat_postMessage = AsyncMock(side_effect=post_message)
+        self.assertEqual(
+            {"C2": "channel_not_found"},
+            aio.run(aio.post_messages(["C1", "C2", "C3"], "hello", pre=True)),
+        )
+        self.assertEqual(3, client.chat_postMessage.await_count)
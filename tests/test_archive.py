@@ -0,0 +1,152 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from slackcli import archive
+from slackcli import errors
+from slackcli import messaging
+
+
+def history(*timestamps, has_more=False):
+    return {
+        "messages": [{"ts": ts, "user": "U1", "text": ts} for ts in timestamps],
+        "has_more": has_more,
+    }
+
+
+@patch.object(messaging, "prefetch_names")
+@patch.object(messaging.slack, "client")
+class ArchiveTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = patch.object(
+            archive,
+            "archive_path",
+            return_value=os.path.join(directory.name, "messages.sqlite3"),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_incremental_sync(self, mock_client, _mock_prefetch):
+        conversations_history = mock_client.return_value.conversations_history
+        conversations_history.side_effect = [
+            history("1700000003.000000", "1700000002.000000", has_more=True),
+            history("1700000001.000000"),
+        ]
+        self.assertFalse(archive.is_archived("C1"))
+        self.assertEqual(3, archive.sync("C1"))
+        self.assertIsNone(conversations_history.call_args_list[0][1]["oldest"])
+        self.assertTrue(archive.is_archived("C1"))
+
+        # Only new messages are fetched
+        conversations_history.side_effect = [history("1700000004.000000")]
+        self.assertEqual(1, archive.sync("C1"))
+        self.assertEqual(
+            "1700000003.000000", conversations_history.call_args[1]["oldest"]
+        )
+
+        # Nothing new
+        conversations_history.side_effect = [history()]
+        self.assertEqual(0, archive.sync("C1"))
+        self.assertEqual(
+            "1700000004.000000", conversations_history.call_args[1]["oldest"]
+        )
+
+    def test_fresh_archive_is_read_without_api_calls(self, mock_client, _mock):
+        with archive.Archive() as message_archive:
+            message_archive.store(
+                "C1",
+                [{"ts": "1700000001.000000"}, {"ts": "1700000002.000000"}],
+            )
+            message_archive.mark_synced("C1", "1700000002.000000")
+
+        pages = list(messaging.iter_conversation_pages("C1", 10))
+        self.assertEqual(
+            ["1700000002.000000", "1700000001.000000"], [m["ts"] for m in pages[0]]
+        )
+        self.assertEqual(
+            [["1700000002.000000"]],
+            [[m["ts"] for m in p] for p in messaging.iter_conversation_pages("C1", 1)],
+        )
+        self.assertEqual(
+            [],
+            list(messaging.iter_conversation_pages("C1", latest="1700000001")),
+        )
+        mock_client.return_value.conversations_history.assert_not_called()
+
+    def test_search_requires_an_archive(self, _mock_client, _mock_prefetch):
+        self.assertRaises(errors.SlackCliError, list, archive.search("hello"))
+        self.assertFalse(os.path.exists(archive.archive_path()))
+
+    def test_stale_archive_is_synced(self, mock_client, _mock_prefetch):
+        with archive.Archive() as message_archive:
+            message_archive.mark_synced("C1", "1700000001.000000")
+        mock_client.return_value.conversations_history.return_value = history(
+            "1700000002.000000"
+        )
+        with patch.object(archive, "is_fresh", return_value=False):
+            pages = list(messaging.iter_conversation_pages("C1", 10))
+        self.assertEqual([["1700000002.000000"]], [[m["ts"] for m in p] for p in pages])
+
+
+class SearchTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive = archive.Archive(os.path.join(directory.name, "messages.sqlite3"))
+        self.addCleanup(self.archive.close)
+        self.archive.store(
+            "C1",
+            [
+                {"ts": "1700000001.000000", "user": "U1", "text": "db-01.prod is down"},
+                {
+                    "ts": "1700000002.000000",
+                    "user": "U2",
+                    "text": "error E1234 on db-02",
+                },
+            ],
+        )
+        self.archive.store(
+            "C2",
+            [
+                {
+                    "ts": "1700000003.000000",
+                    "user": "U1",
+                    "text": "E1234 again on db-01.prod",
+                }
+            ],
+        )
+
+    def search(self, query, **kwargs):
+        return [
+            (channel, message["ts"][9])
+            for channel, message in self.archive.search(query, **kwargs)
+        ]
+
+    def test_search(self):
+        self.assertEqual([("C1", "2"), ("C2", "3")], self.search("e1234"))
+        self.assertEqual([("C1", "1"), ("C2", "3")], self.search("db-01.prod"))
+        self.assertEqual([("C2", "3")], self.search("E1234 db-01.prod"))
+        self.assertEqual([], self.search("db-03"))
+
+    def test_filters(self):
+        self.assertEqual([("C1", "2")], self.search("E1234", channels=["C1"]))
+        self.assertEqual([("C2", "3")], self.search("E1234", users=["U1"]))
+        self.assertEqual([("C1", "1")], self.search("db", latest="1700000002"))
+        self.assertEqual([("C2", "3")], self.search("db", oldest="1700000002"))
+        self.assertEqual([("C1", "2"), ("C2", "3")], self.search("db", count=2))
+        self.assertEqual(
+            [("C2", "3"), ("C1", "2")], self.search("db", count=2, newest_first=True)
+        )
+
+    def test_empty_query(self):
+        self.assertRaises(errors.SlackCliError, self.search, " \t")
+
+    def test_updated_messages_are_reindexed(self):
+        self.archive.store(
+            "C1", [{"ts": "1700000001.000000", "user": "U1", "text": "fixed"}]
+        )
+        self.assertEqual([("C1", "1")], self.search("fixed"))
+        self.assertEqual([("C2", "3")], self.search("db-01.prod"))
@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from slackcli import cache
+
+
+@patch.object(cache.slack, "client")
+class TeamKeyTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.teams_path = os.path.join(directory.name, "teams.json")
+        for name, value in [
+            ("TEAMS_PATH", self.teams_path),
+            ("TOKEN_PATH", os.path.join(directory.name, "slack_token")),
+        ]:
+            patcher = patch.object(cache.token, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.TEAM_IDS.clear()
+        self.addCleanup(cache.TEAM_IDS.clear)
+
+    def test_team_id_is_saved_next_to_the_token(self, mock_client):
+        mock_client.return_value.token = "xoxb-1"
+        mock_client.return_value.auth_test.return_value = {"team_id": "T1"}
+        cache.token.save_team("xoxb-1", "myteam")
+        self.assertEqual("T1", cache.team_key())
+        with open(self.teams_path) as teams_file:
+            self.assertEqual(
+                {"myteam": {"token": "xoxb-1", "team_id": "T1"}}, json.load(teams_file)
+            )
+
+        # The team ID is not fetched again, even in a new run
+        cache.TEAM_IDS.clear()
+        self.assertEqual("T1", cache.team_key())
+        mock_client.return_value.auth_test.assert_called_once()
+
+    def test_tokens_of_the_same_team_share_the_same_key(self, mock_client):
+        cache.token.save_team("xoxb-old", "myteam", team_id="T1")
+        cache.token.save_team("xoxp-new", "myteam-user", team_id="T1")
+        for user_token in ["xoxb-old", "xoxp-new"]:
+            mock_client.return_value.token = user_token
+            self.assertEqual("T1", cache.team_key())
+        mock_client.return_value.auth_test.assert_not_called()
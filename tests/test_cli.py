@@ -0,0 +1,154 @@
+import argparse
+import io
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from slackcli import cli
+
+
+class BatchTests(unittest.TestCase):
+    def test_batch_max_lines(self):
+        stream = io.StringIO("a\nb\n\nc\nd\ne\n")
+        self.assertEqual(
+            [["a", "b"], ["c", "d"], ["e"]],
+            list(cli.iter_batches(stream, interval=60, max_lines=2)),
+        )
+
+    def test_batch_max_bytes(self):
+        stream = io.StringIO("aaa\nbbb\nccc\n" + "x" * 10 + "\n")
+        self.assertEqual(
+            [["aaa", "bbb"], ["ccc"], ["xxxxxxxx"], ["xx"]],
+            list(cli.iter_batches(stream, max_bytes=8)),
+        )
+
+    def test_batch_interval(self):
+        def slow_stream():
+            yield "a\n"
+            yield "b\n"
+            time.sleep(0.3)
+            yield "c\n"
+
+        self.assertEqual(
+            [["a", "b"], ["c"]], list(cli.iter_batches(slow_stream(), interval=0.1))
+        )
+
+    @patch.object(cli.sys, "stdin", new_callable=lambda: io.StringIO("aaa\nbbb\n"))
+    def test_batch_max_bytes_enables_batching(self, _mock_stdin):
+        message_sender = MagicMock()
+        cli.pipe(message_sender, ["C1"], batch_max_bytes=8)
+        message_sender.send.assert_called_once_with(
+            "C1", "aaa\nbbb", pre=False, username=None
+        )
+
+    def test_split_line(self):
+        self.assertEqual(["éé", "é"], list(cli.split_line("ééé", max_bytes=5)))
+        self.assertEqual(["é"], list(cli.split_line("é", max_bytes=1)))
+        self.assertEqual([], list(cli.split_line("")))
+
+
+class DestinationTests(unittest.TestCase):
+    def test_parse_destinations(self):
+        self.assertEqual(
+            ["general", "random", "@alice"],
+            cli.parse_destinations(["general,random", " @alice ", "general"]),
+        )
+
+
+class ParseTimeTests(unittest.TestCase):
+    @patch.object(cli.time, "time", return_value=100000)
+    def test_relative_times(self, _mock_time):
+        self.assertEqual("98200.000000", cli.parse_time("30m"))
+        self.assertEqual("92800.000000", cli.parse_time("2h"))
+        self.assertEqual("13600.000000", cli.parse_time("1d"))
+
+    def test_absolute_times(self):
+        self.assertEqual("1700000000.500000", cli.parse_time("1700000000.5"))
+        self.assertEqual("1714521600.000000", cli.parse_time("2024-05-01T00:00:00Z"))
+        self.assertEqual(
+            "1714525200.000000", cli.parse_time("2024-05-01T03:00:00+02:00")
+        )
+
+    def test_invalid_time(self):
+        self.assertRaises(argparse.ArgumentTypeError, cli.parse_time, "yesterday")
+
+
+class ParserTests(unittest.TestCase):
+    def test_help(self):
+        stdout = io.StringIO()
+        with patch("sys.argv", ["slack-cli", "--help"]), patch("sys.stdout", stdout):
+            self.assertRaises(SystemExit, cli.run)
+        self.assertIn("--follow", stdout.getvalue())
+
+    @patch.object(cli.slack, "init")
+    def test_empty_search_query(self, _mock_init):
+        stderr = io.StringIO()
+        with patch("sys.argv", ["slack-cli", "--search", "  "]), patch(
+            "sys.stderr", stderr
+        ), patch("sys.stdout", io.StringIO()):
+            self.assertEqual(1, cli.run())
+        self.assertIn("--search requires search terms", stderr.getvalue())
+
+
+class SearchTests(unittest.TestCase):
+    @patch.object(cli.names, "sourcename", return_value="random")
+    @patch.object(cli.directory, "name", return_value=None)
+    def test_source_names_fall_back_to_the_api(self, _mock_name, mock_sourcename):
+        self.assertEqual("random", cli.archived_source_name("C2"))
+        mock_sourcename.side_effect = cli.slack.BaseError("channel_not_found", None)
+        self.assertEqual("C3", cli.archived_source_name("C3"))
+
+
+@patch.object(cli.messaging, "get_conversation", side_effect=lambda s: (s, "C1"))
+class ExportTests(unittest.TestCase):
+    @patch.object(cli.sys, "stderr", new_callable=io.StringIO)
+    @patch.object(cli.export, "export")
+    def test_complete_exports_are_not_failures(
+        self, mock_export, mock_stderr, _mock_get_conversation
+    ):
+        mock_export.return_value = [
+            ("general", 3, cli.errors.AlreadyExportedError(3)),
+            ("random", 0, "not_in_channel"),
+        ]
+        self.assertEqual(1, cli.export_sources(["general", "random"], "backup"))
+        self.assertIn("general: already exported", mock_stderr.getvalue())
+        self.assertIn("new export directory", mock_stderr.getvalue())
+
+
+@patch.object(cli.aio, "ENABLED", True)
+@patch.object(cli.messaging, "prefetch_names")
+@patch.object(cli.messaging, "format_incoming_message", side_effect=lambda s, m: s)
+@patch.object(cli.messaging, "get_conversation", side_effect=lambda s: (s, s.upper()))
+class AsyncLastMessagesTests(unittest.TestCase):
+    @patch.object(cli.sys, "stdout", new_callable=io.StringIO)
+    @patch.object(cli.messaging, "iter_conversation_pages")
+    @patch.object(cli.archive, "is_archived", side_effect=lambda c: c == "ARCHIVED")
+    @patch.object(cli.aio, "fetch_histories", new_callable=MagicMock)
+    @patch.object(cli.aio, "run")
+    def test_archived_sources_are_not_fetched(
+        self,
+        mock_run,
+        mock_fetch_histories,
+        _mock_is_archived,
+        mock_iter_conversation_pages,
+        mock_stdout,
+        *_mocks
+    ):
+        mock_run.return_value = [[{"ts": "3"}, {"ts": "1"}]]
+        mock_iter_conversation_pages.return_value = iter([[{"ts": "2"}]])
+        cli.last_messages(["remote", "archived"], 10)
+        mock_fetch_histories.assert_called_once_with(
+            ["REMOTE"], 10, oldest=None, latest=None
+        )
+        mock_iter_conversation_pages.assert_called_once_with(
+            "ARCHIVED", 10, oldest=None, latest=None
+        )
+        self.assertEqual("remote\narchived\nremote\n", mock_stdout.getvalue())
+
+    @patch.object(cli.messaging, "print_timeline")
+    @patch.object(cli.aio, "run")
+    def test_long_histories_are_streamed(self, mock_run, mock_print_timeline, *_mocks):
+        cli.last_messages(["general", "random"], None, oldest="1700000000")
+        cli.last_messages(["general", "random"], cli.aio.MAX_HISTORY_COUNT + 1)
+        mock_run.assert_not_called()
+        self.assertEqual(2, mock_print_timeline.call_count)
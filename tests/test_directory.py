@@ -0,0 +1,209 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from slackcli import directory
+from slackcli import errors
+from slackcli import messaging
+
+RESOURCES = [
+    ("channel", {"id": "C1", "name": "general", "topic": {"value": "chitchat"}}),
+    ("group", {"id": "G1", "name": "general"}),
+    ("user", {"id": "U1", "name": "alice"}),
+]
+
+
+@patch.object(directory.cache, "save")
+@patch.object(directory.cache, "load", return_value=None)
+class DirectoryTests(unittest.TestCase):
+    def setUp(self):
+        directory.Directory.INSTANCE = None
+
+    def tearDown(self):
+        directory.Directory.INSTANCE = None
+
+    def test_refresh_indexes_resources(self, _mock_load, mock_save):
+        directory.refresh(RESOURCES)
+        self.assertEqual(
+            ("channel", {"id": "C1", "name": "general"}), directory.find("general")
+        )
+        self.assertEqual("alice", directory.name("U1"))
+        self.assertIsNone(directory.find("bob"))
+        mock_save.assert_called_once()
+
+    def test_load_from_cache(self, mock_load, _mock_save):
+        mock_load.return_value = {
+            "resources": [["user", {"id": "U1", "name": "alice"}]]
+        }
+        self.assertEqual(
+            ("user", {"id": "U1", "name": "alice"}), directory.find("alice")
+        )
+        self.assertFalse(directory.Directory.instance().fresh)
+
+    def test_get_resource_from_cache(self, mock_load, _mock_save):
+        mock_load.return_value = {
+            "resources": [["user", {"id": "U1", "name": "alice"}]]
+        }
+        with patch.object(messaging, "iter_resources") as mock_iter_resources:
+            self.assertEqual("U1", messaging.get_destination_id("alice"))
+        mock_iter_resources.assert_not_called()
+
+    def test_get_resource_refreshes_on_miss(self, mock_load, _mock_save):
+        mock_load.return_value = {
+            "resources": [["user", {"id": "U1", "name": "alice"}]]
+        }
+        with patch.object(
+            messaging, "iter_resources", return_value=iter(RESOURCES)
+        ) as mock_iter_resources:
+            self.assertEqual("C1", messaging.get_destination_id("general"))
+            self.assertRaises(errors.SlackCliError, messaging.get_resource, "bob")
+        # The directory is fetched at most once per run
+        mock_iter_resources.assert_called_once()
+
+    def test_precedence_does_not_depend_on_order(self, _mock_load, _mock_save):
+        directory.refresh(RESOURCES[::-1])
+        self.assertEqual("channel", directory.find("general")[0])
+
+
+class IterResourcesTests(unittest.TestCase):
+    def test_iter_resources_fetches_all_types(self):
+        pages = {
+            "channel": [[{"id": "C1"}], [{"id": "C2"}]],
+            "group": [],
+            "im": [[{"id": "D1"}]],
+            "user": [[{"id": "U1"}]],
+        }
+        with patch.object(
+            messaging,
+            "iter_resource_pages",
+            side_effect=lambda resource_type: iter(pages[resource_type]),
+        ):
+            resources = list(messaging.iter_resources())
+        self.assertEqual(
+            [("channel", "C1"), ("channel", "C2"), ("im", "D1"), ("user", "U1")],
+            sorted((t, r["id"]) for t, r in resources),
+        )
+
+    def test_api_errors(self):
+        def api_error(error, status_code=200):
+            response = MagicMock(status_code=status_code, headers={})
+            response.get.return_value = error
+            return messaging.slack.BaseError(error, response)
+
+        errors_by_type = {"im": api_error("missing_scope")}
+
+        def iter_resource_pages(resource_type):
+            if resource_type in errors_by_type:
+                raise errors_by_type[resource_type]
+            return iter([[{"id": resource_type[0].upper() + "1"}]])
+
+        with patch.object(
+            messaging, "iter_resource_pages", side_effect=iter_resource_pages
+        ):
+            # Resource types that cannot be listed are skipped
+            self.assertEqual(
+                ["C1", "G1", "U1"],
+                sorted(r["id"] for _, r in messaging.iter_resources()),
+            )
+            # Other errors are raised
+            errors_by_type["user"] = api_error("internal_error", 500)
+            self.assertRaises(
+                messaging.slack.BaseError, list, messaging.iter_resources()
+            )
+
+    @patch.object(directory.cache, "save")
+    @patch.object(directory.cache, "load", return_value=None)
+    def test_partial_directory_is_not_saved(self, _mock_load, mock_save):
+        directory.Directory.INSTANCE = None
+        self.addCleanup(setattr, directory.Directory, "INSTANCE", None)
+
+        def resources():
+            yield RESOURCES[0]
+            raise messaging.slack.BaseError("internal_error", MagicMock())
+
+        self.assertRaises(messaging.slack.BaseError, directory.refresh, resources())
+        mock_save.assert_not_called()
+        self.assertFalse(directory.Directory.instance().complete)
+
+    @patch.object(messaging.slack.time, "sleep")
+    def test_rate_limited_pages_are_retried(self, _mock_sleep):
+        response = MagicMock(status_code=429, headers={"Retry-After": "1"})
+        method = MagicMock(
+            side_effect=[
+                messaging.slack.BaseError("ratelimited", response),
+                {"channels": [{"id": "C1"}]},
+            ]
+        )
+        self.assertEqual(
+            [[{"id": "C1"}]], list(messaging.slack.iter_pages(method, "channels"))
+        )
+        self.assertEqual(2, method.call_count)
+
+
+@patch.object(directory.cache, "save")
+@patch.object(directory.cache, "load", return_value=None)
+class TypedLookupTests(unittest.TestCase):
+    def setUp(self):
+        directory.Directory.INSTANCE = None
+
+    def tearDown(self):
+        directory.Directory.INSTANCE = None
+
+    def test_parse_resource_name(self, _mock_load, _mock_save):
+        self.assertEqual(
+            (("channel", "group"), "general"),
+            messaging.parse_resource_name("#general"),
+        )
+        self.assertEqual((("user",), "alice"), messaging.parse_resource_name("@alice"))
+        self.assertEqual(
+            (directory.RESOURCE_TYPES, "alice"), messaging.parse_resource_name("alice")
+        )
+
+    def test_user_lookup_skips_conversations(self, _mock_load, mock_save):
+        pages = {
+            "user": [[{"id": "U2", "name": "bob"}], [{"id": "U1", "name": "alice"}]]
+        }
+        with patch.object(
+            messaging,
+            "iter_resource_pages",
+            side_effect=lambda resource_type: iter(pages[resource_type]),
+        ) as mock_pages:
+            self.assertEqual(
+                ("user", {"id": "U1", "name": "alice"}),
+                messaging.get_resource("@alice"),
+            )
+        mock_pages.assert_called_once_with("user")
+        # The user is now cached, but the directory is not complete
+        self.assertEqual("U1", messaging.get_destination_id("@alice"))
+        self.assertFalse(directory.Directory.instance().complete)
+        mock_save.assert_called_once()
+
+    def test_channel_prefix_ignores_users(self, mock_load, _mock_save):
+        mock_load.return_value = {"resources": RESOURCES[2:], "complete": True}
+        with patch.object(messaging, "search_resource", return_value=None):
+            self.assertRaises(errors.SlackCliError, messaging.get_resource, "#alice")
+
+    def test_email_lookup(self, _mock_load, _mock_save):
+        with patch.object(messaging.slack, "client") as mock_client:
+            mock_client.return_value.users_lookupByEmail.return_value = {
+                "user": {"id": "U1", "name": "alice"}
+            }
+            self.assertEqual("U1", messaging.get_destination_id("@alice@example.com"))
+        mock_client.return_value.users_lookupByEmail.assert_called_once_with(
+            email="alice@example.com"
+        )
+
+    def test_get_resource_by_id(self, _mock_load, _mock_save):
+        with patch.object(messaging, "iter_resources") as mock_iter_resources:
+            self.assertEqual(
+                ("channel", {"id": "C0123ABCD", "name": "C0123ABCD"}),
+                messaging.get_resource("C0123ABCD"),
+            )
+            self.assertEqual("user", messaging.get_resource("U0123ABCD")[0])
+            self.assertEqual("W0123ABCD", messaging.get_destination_id("W0123ABCD"))
+        mock_iter_resources.assert_not_called()
+
+    def test_get_id_resource_type(self, _mock_load, _mock_save):
+        self.assertEqual("im", messaging.get_id_resource_type("D0123ABCD"))
+        self.assertIsNone(messaging.get_id_resource_type("general"))
+        self.assertIsNone(messaging.get_id_resource_type("CAT"))
+        self.assertIsNone(messaging.get_id_resource_type("X0123ABCD"))
@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import patch
 
 from slackcli import emoji
 
@@ -31,7 +32,28 @@ class EmojiTests(unittest.TestCase):
             emoji.emojize("```Merry christmas ` :christmas_tree:!```"),
         )
 
+    def test_emojize_long_text(self):
+        text = "Deployed :rocket: at 12:30 `make: lint` :smile:\n"
+        self.assertEqual(
+            "Deployed 🚀 at 12:30 `make: lint` 😄\n" * 1000, emoji.emojize(text * 1000)
+        )
+
+    def test_emojize_empty_text(self):
+        self.assertEqual("", emoji.emojize(""))
+        self.assertIsNone(emoji.emojize(None))
+
     def test_unified_to_unicode(self):
         self.assertEqual("🍺", emoji.unified_to_unicode("1F37A"))
         self.assertEqual("#️⃣", emoji.unified_to_unicode("0023-FE0F-20E3"))
         self.assertEqual("🎖️", emoji.unified_to_unicode("1F396-FE0F"))
+
+    def test_memoized_misses_are_bounded(self):
+        table = emoji.EmojiTable(emoji.Emojis.TABLE_PATH)
+        self.assertEqual("🎄", table["christmas_tree"])
+        with patch.object(emoji.EmojiTable, "MAX_MISSES", 2):
+            for name in ["a:", "b:", "c:"]:
+                self.assertIsNone(table[name])
+        self.assertEqual("🎄", table["christmas_tree"])
+        self.assertEqual(
+            ["c:"], [name for name, value in table.items() if value is None]
+        )
@@ -0,0 +1,86 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from slackcli import export
+
+
+def page(*timestamps, cursor=None):
+    return {
+        "messages": [{"ts": ts} for ts in timestamps],
+        "response_metadata": {"next_cursor": cursor},
+    }
+
+
+@patch.object(export.sender.TokenBucket, "acquire")
+@patch.object(export.slack, "client")
+class ExportTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = export.export_path(self.directory, "general")
+
+    def exported(self):
+        with gzip.open(self.path) as export_file:
+            return [json.loads(line)["ts"] for line in export_file]
+
+    def test_export(self, mock_client, _mock_acquire):
+        mock_client.return_value.conversations_history.side_effect = [
+            page("3", "2", cursor="next"),
+            page("1"),
+        ]
+        self.assertEqual(
+            [("general", 3, None)], export.export([("general", "C1")], self.directory)
+        )
+        self.assertEqual(["3", "2", "1"], self.exported())
+        # Complete exports are not fetched again, and are reported as such
+        [(name, count, error)] = export.export([("general", "C1")], self.directory)
+        self.assertEqual(("general", 3), (name, count))
+        self.assertIsInstance(error, export.errors.AlreadyExportedError)
+        self.assertEqual(["3", "2", "1"], self.exported())
+        self.assertEqual(2, mock_client.return_value.conversations_history.call_count)
+
+    def test_interrupted_export_is_resumed(self, mock_client, _mock_acquire):
+        history = mock_client.return_value.conversations_history
+        history.side_effect = [page("3", "2", cursor="next"), KeyboardInterrupt()]
+        self.assertRaises(
+            KeyboardInterrupt, export.export, [("general", "C1")], self.directory
+        )
+        # Simulate a page that was partially written when the export was interrupted
+        with open(self.path, "ab") as export_file:
+            export_file.write(b"\x1f\x8b\x08garbage")
+
+        history.side_effect = [page("1")]
+        self.assertEqual(
+            [("general", 3, None)], export.export([("general", "C1")], self.directory)
+        )
+        self.assertEqual("next", history.call_args[1]["cursor"])
+        self.assertEqual(["3", "2", "1"], self.exported())
+        self.assertTrue(os.path.exists(self.path + ".checkpoint"))
+
+    def test_errors_are_reported_per_conversation(self, mock_client, _mock_acquire):
+        response = MagicMock(status_code=200, headers={})
+        response.get.return_value = "not_in_channel"
+
+        def conversations_history(channel, **_kwargs):
+            if channel == "C2":
+                raise export.slack.BaseError("not_in_channel", response)
+            return page("1")
+
+        mock_client.return_value.conversations_history.side_effect = (
+            conversations_history
+        )
+        self.assertEqual(
+            [("general", 1, None), ("random", 0, "not_in_channel")],
+            export.export([("general", "C1"), ("random", "C2")], self.directory),
+        )
+
+    def test_export_path(self, _mock_client, _mock_acquire):
+        self.assertEqual(
+            os.path.join("exports", "a_b.jsonl.gz"),
+            export.export_path("exports", "a/b"),
+        )
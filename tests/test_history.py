@@ -0,0 +1,130 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from slackcli import messaging
+
+
+def history_pages(*pages):
+    """
+    Fake conversations.history responses, for pages of message timestamps sorted by
+    descending date.
+    """
+    return [
+        {
+            "messages": [{"ts": ts, "text": ts} for ts in page],
+            "has_more": index < len(pages) - 1,
+        }
+        for index, page in enumerate(pages)
+    ]
+
+
+@patch.object(messaging, "prefetch_names")
+@patch.object(messaging.slack, "client")
+class HistoryTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(messaging.archive, "is_archived", return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_iter_history_pages(self, mock_client, _mock_prefetch):
+        history = mock_client.return_value.conversations_history
+        history.side_effect = history_pages(["5", "4"], ["3", "2"], ["1"])
+        pages = list(messaging.iter_history_pages("C1", 4))
+        self.assertEqual(
+            [["5", "4"], ["3", "2"]], [[m["ts"] for m in p] for p in pages]
+        )
+        self.assertEqual("4", history.call_args_list[1][1]["latest"])
+        self.assertEqual(2, history.call_args_list[1][1]["limit"])
+        self.assertEqual(2, history.call_count)
+
+    def test_iter_chronological(self, _mock_client, _mock_prefetch):
+        pages = [[{"ts": "5"}, {"ts": "4"}], [{"ts": "3"}], [{"ts": "2"}, {"ts": "1"}]]
+        self.assertEqual(
+            ["1", "2", "3", "4", "5"],
+            [m["ts"] for m in messaging.iter_chronological(iter(pages))],
+        )
+        self.assertEqual(
+            ["4", "5"],
+            [m["ts"] for m in messaging.iter_chronological(iter(pages[:1]))],
+        )
+        self.assertEqual([], list(messaging.iter_chronological(iter([]))))
+
+    @patch.object(messaging, "get_conversation", return_value=("general", "C1"))
+    @patch.object(
+        messaging, "format_incoming_message", side_effect=lambda s, m: m["ts"]
+    )
+    def test_print_messages_order(self, _mock_format, _mock_get, mock_client, _mock):
+        history = mock_client.return_value.conversations_history
+        for newest_first, expected in [(False, "1 2 3"), (True, "3 2 1")]:
+            history.side_effect = history_pages(["3", "2"], ["1"])
+            with patch("builtins.print") as mock_print:
+                messaging.print_messages("general", 10, newest_first=newest_first)
+            self.assertEqual(
+                expected, " ".join(c[0][0] for c in mock_print.call_args_list)
+            )
+
+    def test_time_range(self, mock_client, _mock_prefetch):
+        history = mock_client.return_value.conversations_history
+        history.side_effect = history_pages(["5", "4"], ["3"])
+        pages = list(messaging.iter_history_pages("C1", oldest="2", latest="6"))
+        self.assertEqual(3, sum(len(page) for page in pages))
+        for call in history.call_args_list:
+            self.assertEqual("2", call[1]["oldest"])
+            self.assertEqual(1000, call[1]["limit"])
+        self.assertEqual("4", history.call_args_list[1][1]["latest"])
+
+    @patch.object(
+        messaging,
+        "format_incoming_message",
+        side_effect=lambda source, message: "{}:{}".format(source, message["ts"]),
+    )
+    def test_print_timeline(self, _mock_format, mock_client, _mock_prefetch):
+        histories = {
+            "C1": history_pages(["5", "1"]),
+            "C2": history_pages(["4", "3"], ["2"]),
+        }
+        mock_client.return_value.conversations_history.side_effect = (
+            lambda channel, **kwargs: histories[channel].pop(0)
+        )
+        with patch.object(
+            messaging, "get_conversation", side_effect=lambda name: (name, name)
+        ), patch("builtins.print") as mock_print:
+            messaging.print_timeline(["C1", "C2"], count=10)
+        self.assertEqual(
+            ["C1:1", "C2:2", "C2:3", "C2:4", "C1:5"],
+            [c[0][0] for c in mock_print.call_args_list],
+        )
+
+    def test_iter_in_background_raises_errors(self, _mock_client, _mock_prefetch):
+        def fail():
+            yield 1
+            raise ValueError()
+
+        messages = messaging.iter_in_background(fail())
+        self.assertEqual(1, next(messages))
+        self.assertRaises(ValueError, next, messages)
+
+    def test_sources_are_fetched_concurrently(self, mock_client, _mock_prefetch):
+        # Each source has a single page, such that a fetch can only overlap with the
+        # fetch of another source
+        running = []
+        overlaps = []
+        lock = threading.Lock()
+
+        def conversations_history(channel, **_kwargs):
+            with lock:
+                running.append(channel)
+                overlaps.append(len(running) > 1)
+            time.sleep(0.2)
+            with lock:
+                running.remove(channel)
+            return history_pages([channel])[0]
+
+        mock_client.return_value.conversations_history.side_effect = (
+            conversations_history
+        )
+        timeline = messaging.iter_timeline([("c1", "1"), ("c2", "2")], count=10)
+        self.assertEqual(["1", "2"], [message["ts"] for _, message in timeline])
+        self.assertEqual([False, True], sorted(overlaps))
@@ -0,0 +1,181 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from slackcli import messaging
+from slackcli import names
+
+
+@patch.object(names.cache, "save")
+@patch.object(names.cache, "load", return_value=None)
+class UserIndexTests(unittest.TestCase):
+    def setUp(self):
+        names.UserIndex.INSTANCE = None
+
+    def tearDown(self):
+        names.UserIndex.INSTANCE = None
+
+    @patch.object(names.slack, "client")
+    def test_im_names_are_joined_with_user_list(
+        self, mock_client, _mock_load, _mock_save
+    ):
+        client = mock_client.return_value
+        client.users_list.side_effect = [
+            {
+                "members": [{"id": "U1", "name": "alice"}],
+                "response_metadata": {"next_cursor": "next"},
+            },
+            {"members": [{"id": "U2", "name": "bob"}]},
+        ]
+        client.conversations_list.return_value = {
+            "channels": [{"id": "D1", "user": "U1"}, {"id": "D2", "user": "U2"}]
+        }
+        self.assertEqual(
+            [{"id": "D1", "user": "U1", "name": "alice"}],
+            [
+                im
+                for page in messaging.iter_resource_pages("im")
+                for im in page
+                if im["id"] == "D1"
+            ],
+        )
+        self.assertEqual("U2", names.get_user_id("Bob"))
+        self.assertEqual(2, client.users_list.call_count)
+        client.users_info.assert_not_called()
+
+    @patch.object(names.slack, "client")
+    def test_listing_is_resumed_after_early_stop(
+        self, mock_client, _mock_load, _mock_save
+    ):
+        client = mock_client.return_value
+        client.users_list.side_effect = [
+            {
+                "members": [{"id": "U1", "name": "alice", "real_name": "Alice"}],
+                "response_metadata": {"next_cursor": "next"},
+            },
+            {"members": [{"id": "U2", "name": "bob"}]},
+        ]
+        pages = names.UserIndex.instance().iter_member_pages()
+        self.assertEqual("Alice", next(pages)[0]["real_name"])
+        # The first caller is still iterating: the lock must not be held
+        user_ids = []
+        thread = threading.Thread(
+            target=lambda: user_ids.append(names.get_user_id("bob")), daemon=True
+        )
+        thread.start()
+        thread.join(5)
+        self.assertEqual(["U2"], user_ids)
+        self.assertEqual(
+            [[{"id": "U2", "name": "bob"}]],
+            list(pages),
+        )
+        self.assertEqual(2, client.users_list.call_count)
+
+    @patch.object(names.slack, "client")
+    def test_names_are_resolved_from_cache(self, mock_client, mock_load, mock_save):
+        mock_load.return_value = {
+            "users": {"U1": ["Alice", 1]},
+            "bots": {"B1": "deploybot"},
+            "listed": time.time(),
+        }
+        self.assertEqual("Alice", names.username("U1"))
+        self.assertEqual("U1", names.get_user_id("alice"))
+        self.assertEqual("deploybot", names.botname("B1"))
+        mock_client.assert_not_called()
+        names.save_users()
+        mock_save.assert_not_called()
+
+    @patch.object(names.slack, "client")
+    def test_stale_cache_is_merged(self, mock_client, mock_load, mock_save):
+        mock_load.return_value = {
+            "users": {"U1": ["alice", 10], "U2": ["bob", 10]},
+            "listed": 0,
+        }
+        mock_client.return_value.users_list.return_value = {
+            "members": [
+                {"id": "U1", "name": "alice2", "updated": 20},
+                {"id": "U2", "name": "bobby", "updated": 5},
+            ]
+        }
+        self.assertEqual("alice2", names.username("U1"))
+        self.assertEqual("bob", names.username("U2"))
+        mock_client.return_value.users_list.assert_called_once()
+        self.assertEqual(
+            {"U1": ("alice2", 20), "U2": ("bob", 10)},
+            mock_save.call_args[0][1]["users"],
+        )
+
+    @patch.object(names.slack, "client")
+    def test_prefetch_message_names(self, mock_client, _mock_load, _mock_save):
+        client = mock_client.return_value
+        client.users_info.side_effect = lambda user: {
+            "user": {"id": user, "name": user.lower()}
+        }
+        client.bots_info.return_value = {"bot": {"id": "B1", "name": "deploybot"}}
+        messaging.prefetch_names(
+            [
+                {"user": "U1", "text": "Hi <@U2> and <@U1>"},
+                {"bot_id": "B1", "text": "Deployed"},
+                {"username": "webhook", "bot_id": "B2", "text": ""},
+            ]
+        )
+        self.assertEqual(2, client.users_info.call_count)
+        client.bots_info.assert_called_once_with(bot="B1")
+        self.assertEqual("u2", names.username("U2"))
+        self.assertEqual("deploybot", names.botname("B1"))
+        self.assertEqual(2, client.users_info.call_count)
+
+
+@patch.object(names.cache, "save")
+@patch.object(names.cache, "load", return_value=None)
+@patch.object(names.slack, "client")
+class SourceIndexTests(unittest.TestCase):
+    def setUp(self):
+        names.UserIndex.INSTANCE = None
+        names.SourceIndex.INSTANCE = None
+
+    def tearDown(self):
+        names.UserIndex.INSTANCE = None
+        names.SourceIndex.INSTANCE = None
+
+    def test_names_are_resolved_on_demand(self, mock_client, *_mocks):
+        client = mock_client.return_value
+        client.conversations_info.side_effect = lambda channel: {
+            "C1": {"channel": {"id": "C1", "name": "general"}},
+            "D1": {"channel": {"id": "D1", "user": "U1"}},
+        }[channel]
+        client.users_info.return_value = {"user": {"id": "U1", "name": "alice"}}
+        self.assertEqual("general", names.sourcename("C1"))
+        self.assertEqual("alice", names.sourcename("D1"))
+        self.assertEqual("general", names.sourcename("C1"))
+        self.assertEqual(2, client.conversations_info.call_count)
+        client.conversations_list.assert_not_called()
+
+    def test_warm_up(self, mock_client, *_mocks):
+        client = mock_client.return_value
+        client.users_list.return_value = {"members": [{"id": "U1", "name": "alice"}]}
+        client.conversations_list.return_value = {
+            "channels": [{"id": "D1", "user": "U1"}]
+        }
+        names.warm_up_sources()
+        names.SourceIndex.instance().warm_up_thread.join()
+        self.assertEqual("alice", names.sourcename("D1"))
+        client.conversations_info.assert_not_called()
+
+
+class SingletonTests(unittest.TestCase):
+    def test_instance_is_created_once(self):
+        class Slow(names.Singleton):
+            created = 0
+
+            def __init__(self):
+                Slow.created += 1
+                time.sleep(0.05)
+
+        threads = [threading.Thread(target=Slow.instance) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, Slow.created)
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from slackcli import sender
+
+
+def api_error(status_code, error):
+    response = MagicMock(status_code=status_code, headers={"Retry-After": "2"})
+    response.get.return_value = error
+    return sender.slack.BaseError(error, response)
+
+
+@patch.object(sender.TokenBucket, "acquire")
+@patch.object(sender.time, "sleep")
+@patch.object(sender.messaging, "post_message")
+class SenderTests(unittest.TestCase):
+    def test_messages_are_sent_in_order(
+        self, mock_post_message, _mock_sleep, _mock_acquire
+    ):
+        with sender.Sender(workers=3) as message_sender:
+            for i in range(10):
+                message_sender.send("C1", str(i))
+                message_sender.send("C2", str(i))
+        self.assertEqual(20, message_sender.sent)
+        for channel in ["C1", "C2"]:
+            self.assertEqual(
+                [str(i) for i in range(10)],
+                [
+                    c[0][1]
+                    for c in mock_post_message.call_args_list
+                    if c[0][0] == channel
+                ],
+            )
+
+    def test_rate_limited_message_is_retried(
+        self, mock_post_message, mock_sleep, _mock_acquire
+    ):
+        mock_post_message.side_effect = [api_error(429, "ratelimited"), None]
+        with sender.Sender() as message_sender:
+            message_sender.send("C1", "hello", username="bot")
+        self.assertEqual("1 sent, 1 retried, 0 dropped", message_sender.summary())
+        mock_post_message.assert_called_with("C1", "hello", pre=False, username="bot")
+        self.assertLessEqual(2, mock_sleep.call_args[0][0])
+
+    @patch.object(sender.sys, "stderr")
+    def test_errors_are_reported_per_destination(
+        self, _mock_stderr, mock_post_message, _mock_sleep, _mock_acquire
+    ):
+        def post_message(destination_id, *_args, **_kwargs):
+            if destination_id == "C2":
+                raise api_error(404, "channel_not_found")
+
+        mock_post_message.side_effect = post_message
+        with sender.Sender(workers=3) as message_sender:
+            for destination_id in ["C1", "C2", "C3"]:
+                message_sender.send(destination_id, "hello")
+        self.assertEqual({"C2": "channel_not_found"}, message_sender.errors)
+        self.assertEqual(2, message_sender.sent)
+
+    @patch.object(sender.sys, "stderr")
+    def test_failed_message_is_dropped(
+        self, mock_stderr, mock_post_message, _mock_sleep, _mock_acquire
+    ):
+        mock_post_message.side_effect = api_error(404, "channel_not_found")
+        with sender.Sender(max_retries=0) as message_sender:
+            message_sender.send("C1", "hello")
+        self.assertEqual(1, message_sender.dropped)
+        self.assertIn("channel_not_found", mock_stderr.write.call_args[0][0])
+
+
+class TokenBucketTests(unittest.TestCase):
+    @patch.object(sender.time, "sleep")
+    @patch.object(sender.time, "monotonic")
+    def test_bucket_waits_when_empty(self, mock_monotonic, mock_sleep):
+        clock = [100.0]
+        mock_monotonic.side_effect = lambda: clock[0]
+        mock_sleep.side_effect = lambda delay: clock.__setitem__(0, clock[0] + delay)
+        bucket = sender.TokenBucket(rate=2, capacity=2)
+        bucket.acquire()
+        bucket.acquire()
+        mock_sleep.assert_not_called()
+        bucket.acquire()
+        self.assertAlmostEqual(0.5, mock_sleep.call_args[0][0])
+        self.assertAlmostEqual(100.5, clock[0])
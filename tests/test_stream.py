@@ -0,0 +1,265 @@
+import threading
+from types import SimpleNamespace
+import unittest
+from unittest.mock import patch
+
+from slackcli import errors
+from slackcli import stream
+
+
+class EventQueueTests(unittest.TestCase):
+    def test_drop_oldest(self):
+        event_queue = stream.EventQueue(maxsize=2, overflow="drop-oldest")
+        for ts in "123":
+            event_queue.put({"ts": ts})
+        self.assertEqual(1, event_queue.dropped)
+        self.assertEqual("2", event_queue.get()["ts"])
+        self.assertEqual("3", event_queue.get()["ts"])
+
+    def test_spill(self):
+        event_queue = stream.EventQueue(maxsize=2, overflow="spill")
+        for ts in "12345":
+            event_queue.put({"ts": ts})
+        self.assertEqual(3, event_queue.spilled)
+        self.assertEqual(5, event_queue.depth)
+        self.assertEqual("1", event_queue.get()["ts"])
+        # New events are queued after the spilled ones
+        event_queue.put({"ts": "6"})
+        self.assertEqual(
+            ["2", "3", "4", "5", "6"], [event_queue.get()["ts"] for _ in range(5)]
+        )
+        self.assertEqual(0, event_queue.depth)
+        self.assertEqual(5, event_queue.max_depth)
+        event_queue.close()
+
+    def test_block(self):
+        event_queue = stream.EventQueue(maxsize=1)
+        event_queue.put({"ts": "1"})
+        thread = threading.Thread(target=event_queue.put, args=({"ts": "2"},))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual("1", event_queue.get()["ts"])
+        thread.join()
+        self.assertEqual("2", event_queue.get()["ts"])
+        self.assertEqual(0, event_queue.dropped)
+
+    def test_invalid_policy(self):
+        self.assertRaises(errors.SlackCliError, stream.EventQueue, 1, "ignore")
+
+
+class PrinterTests(unittest.TestCase):
+    def test_events_are_printed_in_order_per_channel(self):
+        printed = []
+        done = threading.Event()
+
+        def format_event(event):
+            if event["ts"] == "fail":
+                raise ValueError()
+            if event["ts"] == "ignore":
+                return None
+            printed.append((event["channel"], event["ts"]))
+            if len(printed) == 200:
+                done.set()
+            return ""
+
+        printer = stream.Printer(format_event, workers=3)
+        for ts in range(100):
+            for channel in ["C1", "C2"]:
+                printer.submit({"channel": channel, "ts": ts})
+        printer.submit({"channel": "C3", "ts": "fail"})
+        printer.submit({"channel": "C3", "ts": "ignore"})
+        self.assertTrue(done.wait(5))
+        printer.close()
+        for channel in ["C1", "C2"]:
+            self.assertEqual(
+                list(range(100)), [ts for c, ts in printed if c == channel]
+            )
+
+    def test_held_events_are_printed_last(self):
+        printed = []
+        done = threading.Event()
+
+        def format_event(event):
+            printed.append(event["ts"])
+            if len(printed) == 3:
+                done.set()
+            return ""
+
+        printer = stream.Printer(format_event, workers=2)
+        printer.hold()
+        printer.submit({"channel": "C1", "ts": "3"})
+        printer.submit({"channel": "C1", "ts": "1"}, hold=False)
+        printer.submit({"channel": "C1", "ts": "2"}, hold=False)
+        printer.release()
+        self.assertTrue(done.wait(5))
+        printer.close()
+        self.assertEqual(["1", "2", "3"], printed)
+
+    def test_channels_are_assigned_to_a_single_worker(self):
+        printer = stream.Printer(lambda event: None, workers=4, paused=True)
+        threads = [
+            threading.Thread(
+                target=lambda: [
+                    printer.submit({"channel": channel, "ts": "1"})
+                    for channel in range(100)
+                ]
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        channels = [{event["channel"] for event in q.items} for q in printer.queues]
+        self.assertEqual(400, sum(len(q.items) for q in printer.queues))
+        self.assertEqual(100, len(set().union(*channels)))
+        self.assertEqual(100, sum(len(c) for c in channels))
+        printer.close()
+
+
+class ResolveSourcesTests(unittest.TestCase):
+    def test_resolve_sources(self):
+        with patch.object(
+            stream.messaging,
+            "get_conversation",
+            side_effect=lambda name: (name.lstrip("#@"), name.upper()),
+        ) as mock_get_conversation:
+            self.assertIsNone(stream.resolve_sources(["general", "all"]))
+            mock_get_conversation.assert_not_called()
+            self.assertEqual(
+                {"#GENERAL": "general", "@ALICE": "alice"},
+                stream.resolve_sources(["#general", "@alice"]),
+            )
+
+
+class BackfillTests(unittest.TestCase):
+    def test_deduplication(self):
+        backfill = stream.Backfill(capacity=2)
+        self.assertTrue(backfill.add({"channel": "C1", "ts": "1"}))
+        self.assertFalse(backfill.add({"channel": "C1", "ts": "1"}))
+        self.assertTrue(backfill.add({"channel": "C2", "ts": "1"}))
+        self.assertTrue(backfill.add({"channel": "C1", "ts": "2"}))
+        # Oldest messages are forgotten
+        self.assertTrue(backfill.add({"channel": "C1", "ts": "1"}))
+        self.assertEqual({"C1": "2", "C2": "1"}, backfill.last_ts)
+
+    def test_reconnection(self):
+        backfill = stream.Backfill()
+        self.assertFalse(backfill.connected())
+        self.assertIsNone(backfill.gap())
+        backfill.disconnected(1000, "closed")
+        self.assertTrue(backfill.connected())
+        self.assertLess(backfill.gap(), 1)
+        self.assertIsNone(backfill.gap())
+        # Disconnection reported after the reconnection
+        self.assertTrue(backfill.connected())
+        backfill.disconnected(1000, "closed")
+        self.assertIsNone(backfill.gap())
+        self.assertIsNone(backfill.disconnected_at)
+
+    @patch.object(stream.messaging, "iter_history_pages")
+    def test_iter_missed(self, mock_iter_history_pages):
+        backfill = stream.Backfill(["C1"])
+        backfill.add({"channel": "C1", "ts": "2"})
+        backfill.add({"channel": "C1", "ts": "4"})
+        backfill.add({"channel": "C1", "ts": "5"})
+        backfill.connected()
+        self.assertEqual([], list(backfill.iter_missed()))
+        backfill.connected()
+        # Message 7 is received after the reconnection, before the backfill
+        backfill.add({"channel": "C1", "ts": "7"})
+        # Message 7 was received live, but not message 6
+        mock_iter_history_pages.return_value = iter(
+            [[{"ts": "7"}, {"ts": "6"}, {"ts": "5", "subtype": "bot_message"}]]
+        )
+        self.assertEqual([{"channel": "C1", "ts": "6"}], list(backfill.iter_missed()))
+        mock_iter_history_pages.assert_called_once_with("C1", oldest="5")
+        self.assertEqual([], list(backfill.iter_missed()))
+
+
+class FakeSocketModeClient:
+    """
+    Socket Mode client that receives live events as soon as it is connected.
+    """
+
+    EVENTS = []
+    KWARGS = {}
+
+    def __init__(self, **kwargs):
+        FakeSocketModeClient.KWARGS = kwargs
+        self.socket_mode_request_listeners = []
+        self.on_message_listeners = []
+        self.on_close_listeners = []
+
+    def connect(self):
+        for listener in self.on_message_listeners:
+            listener('{"type": "hello"}')
+        for event in self.EVENTS:
+            request = SimpleNamespace(
+                envelope_id="envelope",
+                type="events_api",
+                payload={"event": dict(event, type="message", channel="C1")},
+            )
+            for listener in self.socket_mode_request_listeners:
+                listener(self, request)
+
+    def send_socket_mode_response(self, response):
+        pass
+
+    def close(self):
+        pass
+
+
+@patch.object(stream.token_module, "load_app_token", return_value="xapp-test")
+@patch.object(stream.slack, "client")
+@patch.object(stream, "SocketModeClient", FakeSocketModeClient)
+@patch.object(stream.messaging, "get_conversation", return_value=("general", "C1"))
+@patch.object(
+    stream.messaging,
+    "format_incoming_message",
+    side_effect=lambda source, message: message["ts"],
+)
+class FollowTests(unittest.TestCase):
+    def test_follow(self, *_mocks):
+        # Message 3 is both in the history and received live, while the history is
+        # fetched
+        FakeSocketModeClient.EVENTS = [{"ts": "3"}, {"ts": "4"}]
+        history = [(("general", "C1"), {"ts": "2"}), (("general", "C1"), {"ts": "3"})]
+        printed = []
+        done = threading.Event()
+
+        def print_line(text, **_kwargs):
+            printed.append(text)
+            if len(printed) == 3:
+                done.set()
+
+        def sleep(_seconds):
+            done.wait(5)
+            raise KeyboardInterrupt()
+
+        with patch.object(
+            stream.messaging, "iter_timeline", return_value=iter(history)
+        ) as mock_iter_timeline, patch(
+            "builtins.print", side_effect=print_line
+        ), patch.object(
+            stream.time, "sleep", side_effect=sleep
+        ):
+            stream.receive(["general"], last=2)
+        self.assertEqual(["2", "3", "4"], printed)
+        # Events are received in order
+        self.assertEqual(1, FakeSocketModeClient.KWARGS["concurrency"])
+        mock_iter_timeline.assert_called_once_with(
+            [("general", "C1")], count=2, oldest=None
+        )
+
+    def test_connection_is_closed_on_history_errors(self, *_mocks):
+        FakeSocketModeClient.EVENTS = []
+        with patch.object(
+            stream.messaging, "iter_timeline", side_effect=KeyboardInterrupt()
+        ), patch.object(FakeSocketModeClient, "close") as mock_close, patch.object(
+            stream.Printer, "close"
+        ) as mock_printer_close:
+            stream.receive(["general"], last=2)
+        mock_close.assert_called_once()
+        mock_printer_close.assert_called_once()
@@ -0,0 +1,78 @@
+import http.server
+import json
+import threading
+import unittest
+
+from slack_sdk import WebClient
+
+from slackcli import slack
+from slackcli import transport
+
+
+class SlackHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/chat.postMessage"):
+            self.respond(
+                429, {"ok": False, "error": "ratelimited"}, {"Retry-After": "3"}
+            )
+        else:
+            self.respond(200, {"ok": True, "path": self.path})
+        if self.server.close_connections:
+            self.close_connection = True
+
+    def respond(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class PooledWebClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlackHandler)
+        self.server.close_connections = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = transport.PooledWebClient(
+            token="xoxb-test",
+            base_url="http://127.0.0.1:{}/api/".format(self.server.server_port),
+        )
+
+    def tearDown(self):
+        self.client.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.assertEqual("/api/api.test", self.client.api_test()["path"])
+        self.assertEqual(3, self.client.pool.requests)
+        self.assertEqual(1, self.client.pool.connections)
+
+    def test_closed_connections_are_replaced(self):
+        self.server.close_connections = True
+        self.client.api_test()
+        self.client.api_test()
+        self.assertEqual(2, self.client.pool.connections)
+
+    def test_errors_are_raised(self):
+        with self.assertRaises(slack.BaseError) as context:
+            self.client.chat_postMessage(channel="C1", text="hello")
+        self.assertEqual(3, slack.retry_after(context.exception))
+        self.assertEqual("ratelimited", context.exception.response["error"])
+        # Error responses do not close the connection
+        self.client.api_test()
+        self.assertEqual(1, self.client.pool.connections)
+
+    def test_overridden_method_exists(self):
+        # PooledWebClient relies on a private method of the slack_sdk WebClient
+        self.assertTrue(hasattr(WebClient, "_perform_urllib_http_request_internal"))
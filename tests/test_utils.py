@@ -1,7 +1,8 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from slackcli import messaging
+from slackcli import slack
 
 
 class ParseStatusTests(unittest.TestCase):
@@ -45,3 +46,21 @@ class FormatMessageTests(unittest.TestCase):
             ),
         )
         mock_user_id.assert_called_with("loremipsum")
+
+
+class RateLimitTests(unittest.TestCase):
+    @patch.object(slack.time, "sleep")
+    def test_call_retries_after_rate_limit(self, mock_sleep):
+        response = MagicMock(status_code=429, headers={"Retry-After": "3"})
+        method = MagicMock(
+            side_effect=[slack.BaseError("ratelimited", response), {"ok": True}]
+        )
+        self.assertEqual({"ok": True}, slack.call(method, channel="C1"))
+        method.assert_called_with(channel="C1")
+        self.assertLessEqual(3, mock_sleep.call_args[0][0])
+
+    def test_call_does_not_retry_other_errors(self):
+        response = MagicMock(status_code=200, headers={})
+        method = MagicMock(side_effect=slack.BaseError("channel_not_found", response))
+        self.assertRaises(slack.BaseError, slack.call, method)
+        method.assert_called_once()